@@ -0,0 +1,157 @@
+# ==============================================
+# 💾 Almacén de embeddings por hash de contenido
+# Solo se llama a la API para textos nuevos o modificados
+# ==============================================
+
+import hashlib
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import openai
+
+RUTA_ALMACEN = "cache_embeddings.sqlite"
+
+TAM_LOTE = 512
+# Tope de caracteres por petición para quedar lejos del límite de tokens de la API
+MAX_CARACTERES_LOTE = 400_000
+CONCURRENCIA = 4
+REINTENTOS = 5
+
+ERRORES_REINTENTABLES = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def hash_texto(texto):
+    """Clave de contenido de un texto ya normalizado."""
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class AlmacenEmbeddings:
+    """Vectores guardados en SQLite con clave (modelo, hash del texto normalizado)."""
+
+    def __init__(self, ruta=RUTA_ALMACEN):
+        self.ruta = ruta
+        self._conexion = sqlite3.connect(ruta)
+        self._conexion.execute(
+            """CREATE TABLE IF NOT EXISTS vectores (
+                   modelo TEXT NOT NULL,
+                   hash TEXT NOT NULL,
+                   vector BLOB NOT NULL,
+                   PRIMARY KEY (modelo, hash)
+               )"""
+        )
+        self._conexion.commit()
+
+    def obtener(self, modelo, hashes):
+        """Devuelve {hash: vector float32} para los hashes ya almacenados."""
+        encontrados = {}
+        hashes = list(hashes)
+        # SQLite limita el número de parámetros por consulta
+        for i in range(0, len(hashes), 900):
+            bloque = hashes[i:i + 900]
+            filas = self._conexion.execute(
+                f"SELECT hash, vector FROM vectores WHERE modelo = ? AND hash IN ({','.join('?' * len(bloque))})",
+                [modelo, *bloque],
+            )
+            for h, blob in filas:
+                encontrados[h] = np.frombuffer(blob, dtype=np.float32)
+        return encontrados
+
+    def guardar(self, modelo, vectores):
+        """Guarda {hash: vector} (sobrescribe si ya existía)."""
+        self._conexion.executemany(
+            "INSERT OR REPLACE INTO vectores (modelo, hash, vector) VALUES (?, ?, ?)",
+            [(modelo, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in vectores.items()],
+        )
+        self._conexion.commit()
+
+    def cerrar(self):
+        self._conexion.close()
+
+
+def _lotes(pendientes, tam_lote, max_caracteres):
+    """Agrupa (hash, texto) respetando el nº de entradas y el total de caracteres."""
+    lote, caracteres = [], 0
+    for h, texto in pendientes.items():
+        if lote and (len(lote) >= tam_lote or caracteres + len(texto) > max_caracteres):
+            yield lote
+            lote, caracteres = [], 0
+        lote.append((h, texto))
+        caracteres += len(texto)
+    if lote:
+        yield lote
+
+
+def crear_embeddings(client, modelo, lote, reintentos=REINTENTOS):
+    """Una llamada a embeddings.create con reintentos y backoff exponencial con jitter."""
+    for intento in range(reintentos + 1):
+        try:
+            datos = client.embeddings.create(model=modelo, input=lote).data
+            return [d.embedding for d in sorted(datos, key=lambda d: d.index)]
+        except ERRORES_REINTENTABLES as e:
+            if intento == reintentos:
+                raise
+            espera = min(60, 2 ** intento) * (0.5 + random.random())
+            print(f"⏳ {type(e).__name__} — reintento {intento + 1}/{reintentos} en {espera:.1f}s")
+            time.sleep(espera)
+
+
+def embeber_incremental(
+    client,
+    textos,
+    modelo,
+    almacen,
+    tam_lote=TAM_LOTE,
+    max_caracteres_lote=MAX_CARACTERES_LOTE,
+    concurrencia=CONCURRENCIA,
+):
+    """Devuelve la matriz float32 de `textos` reutilizando los vectores del almacén.
+
+    Los textos deben llegar ya normalizados (quitar_acentos + lower): el hash
+    se calcula sobre ellos. Los que faltan se piden a la API en lotes grandes,
+    con como mucho `concurrencia` peticiones en vuelo. Devuelve también
+    {"reutilizados": filas servidas desde el almacén, "recalculados": textos
+    distintos enviados a la API}.
+    """
+    hashes = [hash_texto(t) for t in textos]
+    vectores = almacen.obtener(modelo, set(hashes))
+    reutilizados = sum(1 for h in hashes if h in vectores)
+
+    # Textos pendientes sin duplicados (el mismo texto solo se embebe una vez)
+    pendientes = {}
+    for h, texto in zip(hashes, textos):
+        if h not in vectores:
+            pendientes.setdefault(h, texto)
+
+    hechos, error = 0, None
+    if pendientes:
+        lotes = list(_lotes(pendientes, tam_lote, max_caracteres_lote))
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            futuros = {
+                pool.submit(crear_embeddings, client, modelo, [t for _, t in lote]): lote
+                for lote in lotes
+            }
+            for futuro in as_completed(futuros):
+                lote = futuros[futuro]
+                if futuro.exception() is not None:
+                    # Los demás lotes ya están pagados: se guardan antes de propagar el error
+                    error = error or futuro.exception()
+                    continue
+                nuevos = {h: v for (h, _), v in zip(lote, futuro.result())}
+                # Se guarda cada lote al terminar: si el proceso se corta, no se pierde lo hecho
+                almacen.guardar(modelo, nuevos)
+                vectores.update({h: np.asarray(v, dtype=np.float32) for h, v in nuevos.items()})
+                hechos += len(lote)
+                print(f"   {hechos}/{len(pendientes)} embeddings nuevos")
+    if error is not None:
+        raise error
+
+    matriz = np.vstack([vectores[h] for h in hashes]) if hashes else np.empty((0, 0), dtype=np.float32)
+    return matriz.astype(np.float32, copy=False), {"reutilizados": reutilizados, "recalculados": len(pendientes)}
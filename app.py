@@ -4,19 +4,27 @@
 # ==============================================
 
 import os
-import pandas as pd
-import numpy as np
-import nltk
-import string
+import time
 import streamlit as st
-import unicodedata
 import markdown
-import re
-import fitz  # PyMuPDF
-from openai import OpenAI
-from sklearn.metrics.pairwise import cosine_similarity
-from nltk.corpus import stopwords
-from datetime import datetime
+import pandas as pd
+
+from base_conocimiento import cargar_base_conocimiento, firma_fuentes
+from cache import CacheEmbeddings, CacheRespuestas
+from cliente_openai import ClienteOpenAI
+from indice import IndiceIncompatibleError
+from enrutado import MOTOR
+from nucleo import ETIQUETAS_ORIGEN, Chatbot
+from trazas import RUTA_TRAZAS, RegistroTrazas, servir_metricas
+
+
+# Mensajes que se guardan por sesión y que se muestran de cada vez
+MAX_MENSAJES = 200
+VENTANA_HISTORIAL = 20
+# Fragmentos recuperados bajo cada respuesta, para depurar (MOSTRAR_FRAGMENTOS=1)
+MOSTRAR_FRAGMENTOS = os.getenv("MOSTRAR_FRAGMENTOS") == "1"
+# Segundos mínimos entre repintados de la respuesta mientras llega
+INTERVALO_PINTADO = 0.05
 
 
 def render_html_markdown(texto):
@@ -24,349 +32,115 @@ def render_html_markdown(texto):
     html = markdown.markdown(texto, extensions=["extra", "sane_lists"])
     return f"<div class='chat-response'>{html}</div>"
 
-def quitar_acentos(texto):
-    """Elimina acentos y caracteres diacríticos de un texto."""
-    return ''.join(
-        c for c in unicodedata.normalize('NFD', texto)
-        if unicodedata.category(c) != 'Mn'
-    )
-
 # ==============================================
 # 1️⃣ CONFIGURACIÓN INICIAL
 # ==============================================
+# Streamlit re-ejecuta el script en cada interacción: el cliente y la base
+# de conocimiento se crean una sola vez por proceso con st.cache_resource.
+# El cliente es asíncrono y lo comparten todas las sesiones (ver cliente_openai).
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-nltk.download("stopwords", quiet=True)
-stop_words = stopwords.words("spanish")
-
-ruta_excel = "conversaciones_revisando.xlsx"
-df = pd.read_excel(ruta_excel)
-df.columns = df.columns.str.strip().str.lower()
-
-# CARGAR Y PROCESAR PDFs
-
-# carpeta_pdfs = "."
-# textos_pdf = []
-# nombres_pdf = []
-
-# for archivo in os.listdir(carpeta_pdfs):
-    # if archivo.lower().endswith(".pdf"):
-        # ruta_pdf = os.path.join(carpeta_pdfs, archivo)
-        # try:
-            # with fitz.open(ruta_pdf) as pdf:
-                # texto = ""
-                # for pagina in pdf:
-                    # texto += pagina.get_text()
-            # textos_pdf.append(texto)
-            # nombres_pdf.append(archivo)
-        # except Exception as e:
-            # print(f"⚠️ Error leyendo {archivo}: {e}")
-
-# if textos_pdf:
-    # print(f"✅ Se cargaron {len(textos_pdf)} PDFs correctamente.")
-# else:
-    # print("⚠️ No se encontraron PDFs en la carpeta especificada.")
-
-consultas = df[df["role"].str.lower() == "user"]["content"].tolist()
-respuestas = df[df["role"].str.lower() == "assistant"]["content"].tolist()
-
-# Normaliza las consultas para comparación exacta (sin acentos)
-consultas_norm = [quitar_acentos(str(c).strip().lower()) for c in consultas]
-pares = list(zip(consultas_norm, respuestas))
+@st.cache_resource
+def obtener_cliente():
+    return ClienteOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# ==============================================
-# 2️⃣ CARGAR EMBEDDINGS PRECALCULADOS
-# ==============================================
-try:
-    emb_consultas = np.load("emb_consultas_comprimido.npz")["emb"]
-    print("✅ Embeddings cargados correctamente.")
-except FileNotFoundError:
-    st.error("❌ No se encontró el archivo 'emb_consultas_comprimido.npz'.")
-    st.stop()
 
-# BIS. EMBEDDINGS DE PDFs
+@st.cache_resource(max_entries=1, show_spinner="Cargando base de conocimiento...")
+def obtener_base_conocimiento(firma):
+    """La firma (mtimes de las fuentes) forma parte de la clave de caché:
+    si cambia el Excel, un PDF o el índice, se vuelve a cargar."""
+    return cargar_base_conocimiento()
 
-try:
-    datos_pdf = np.load("emb_pdfs_comprimido.npz", allow_pickle=True)
-    emb_pdfs = datos_pdf["emb"]
-    nombres_pdf = datos_pdf["nombres"]
-    print(f"✅ Embeddings de {len(nombres_pdf)} PDFs cargados correctamente.")
-except FileNotFoundError:
-    st.warning("⚠️ No se encontró el archivo 'emb_pdfs_comprimido.npz'. Ejecuta primero 'generar_emb_pdfs.py'.")
-    textos_pdf, nombres_pdf, emb_pdfs = [], [], []
 
-# ==============================================
-# 4️⃣ Buscar contexto relevante con embeddings
-# ==============================================
-def buscar_contexto(pregunta, top_k=5, umbral_similitud=0.78):
-    pregunta_normalizada = quitar_acentos(pregunta.strip().lower())
-
-    # Evita que use embeddings para temas tratados explícitamente
-    if re.search(r'(℮|[\"“” ]?e[\"“” ]?metrologic)', pregunta_normalizada):
-        print("🔒 Saltando búsqueda por embeddings (tema e metrológica).")
-        return []
-
-    # ✅ Coincidencia literal exacta (antes de usar embeddings)
-    for i, (preg, resp) in enumerate(pares):
-        if quitar_acentos(str(preg).strip().lower()) == pregunta_normalizada:
-            print("✅ Coincidencia exacta encontrada — usando respuesta literal del Excel.")
-            return [resp]
-
-    # 🔹 Si no hay coincidencia exacta, usar embeddings
-    emb_pregunta = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=pregunta_normalizada
-    ).data[0].embedding
-
-    similitudes = cosine_similarity([emb_pregunta], emb_consultas)[0]
-    indices_ordenados = similitudes.argsort()[-top_k:][::-1]
-
-    if similitudes[indices_ordenados[0]] >= umbral_similitud:
-        print(f"✅ Coincidencia fuerte ({similitudes[indices_ordenados[0]]:.2f}) — usando respuesta del Excel.")
-        return [pares[indices_ordenados[0]][1]]
-
-    print("⚠️ No se encontró coincidencia fuerte — se generará respuesta nueva.")
-    # Si no hay coincidencia fuerte, probar también con PDFs
-    contextos = [pares[i][1] for i in indices_ordenados]
-
-    # 🔹 Buscar también en los PDFs cargados
-    if textos_pdf:
-        emb_pregunta = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=pregunta_normalizada
-        ).data[0].embedding
-
-        similitudes_pdf = cosine_similarity([emb_pregunta], emb_pdfs)[0]
-        idx_pdf = similitudes_pdf.argmax()
-        if similitudes_pdf[idx_pdf] > 0.75:
-            fragmento_pdf = textos_pdf[idx_pdf][:2000]  # Solo un fragmento breve
-            print(f"📄 Coincidencia PDF encontrada en {nombres_pdf[idx_pdf]} ({similitudes_pdf[idx_pdf]:.2f})")
-            contextos.append(fragmento_pdf)
-
-    return contextos
+@st.cache_resource
+def obtener_cache_embeddings():
+    return CacheEmbeddings()
+
+
+@st.cache_resource
+def obtener_cache_respuestas():
+    return CacheRespuestas(umbral=float(os.getenv("UMBRAL_CACHE_RESPUESTAS", "0.95")))
+
+
+@st.cache_resource
+def obtener_registro_trazas():
+    """Trazas de todas las sesiones; con METRICAS_PUERTO se exponen en /metrics."""
+    registro = RegistroTrazas(os.getenv("TRAZAS_RUTA", RUTA_TRAZAS))
+    if os.getenv("METRICAS_PUERTO"):
+        puerto = int(os.getenv("METRICAS_PUERTO"))
+        try:
+            servir_metricas(registro, puerto)
+        except OSError as e:
+            st.warning(f"⚠️ No se pudieron exponer las métricas en el puerto {puerto}: {e}")
+    return registro
 
 
+client = obtener_cliente()
+cache_embeddings = obtener_cache_embeddings()
+cache_respuestas = obtener_cache_respuestas()
+registro_trazas = obtener_registro_trazas()
+
 # ==============================================
-# FRASES POR TEMA
+# 2️⃣ CARGAR BASE DE CONOCIMIENTO (Excel + índice de embeddings)
 # ==============================================
-FRASES_POR_TEMA = {
-    "cosmetico": [
-        "“Un producto cosmético, según el Reglamento (CE) nº 1223/2009, es toda sustancia o mezcla destinada a ser puesta en contacto con las partes superficiales del cuerpo humano (epidermis, sistema piloso y capilar, uñas, labios, órganos genitales externos) o con los dientes y mucosas bucales, con el fin exclusivo o principal de limpiarlos, perfumarlos, modificar su aspecto, protegerlos, mantenerlos en buen estado o corregir los olores corporales.”"
-    ],
-    "cosmetica para animales" : [
-        """Los productos destinados a la higiene o cuidado de animales no se consideran cosméticos y quedan fuera del ámbito de aplicación del Reglamento 1223/2009.
-            
-En el contexto español, estos productos fueron considerados inicialmente como productos zoosanitarios. Tras la publicación del Real Decreto 867/2020 dejaron de estar incluidos en dicho marco, aunque una sentencia del Tribunal Supremo en 2023 anuló parcialmente ese Real Decreto, devolviendo temporalmente a los productos cosméticos para animales la consideración de zoosanitarios.
-
-Finalmente, con la Ley 1/2025, de 1 de abril, que modifica la Ley 8/2003 de sanidad animal, se elimina la obligatoriedad de registro de los productos de higiene, cuidado y manejo de animales (HCM) y del material y utillaje zoosanitario (MUZ). En consecuencia, estos productos quedan fuera del ámbito competencial del Ministerio de Agricultura y Pesca.
-
-Ante esta situación, el pasado mes de junio nos pusimos en contacto con ASEMAZ, quienes nos informaron de lo siguiente:Con la publicación de la Ley 1/2025, determinados productos zoosanitarios destinados a higiene, cuidado y manejo de los animales ya no tienen que ser notificados por el titular de los mismos para su comercialización.
-
-Ahora bien, decimos “determinados” dado que dependiendo del “claim” reivindicado por el producto (biocidas), tendrán las siguientes obligaciones:
-
-**Registro nacional:**\n
-- Si se trata de un zoosanitario para uso en entorno ganadero (insecticida, larvicida, desinfectante, etc.), deberá solicitarse su registro ante el **MAPA** como plaguicida, con los correspondientes ensayos según la eficacia que se quiera defender.  
-  Más información: [Registro de productos zoosanitarios - MAPA](https://www.mapa.gob.es/es/ganaderia/temas/sanidad-animal-higiene-ganadera/Higiene-de-la-produccion-primaria-ganadera/registro-de-productos-zoosanitarios/)\n
-- Si se trata de un plaguicida no agrícola (desinfectante de uso en la industria alimentaria o uso ambiental, rodenticida, etc.), deberá solicitarse su registro ante **Sanidad** como plaguicida no agrícola.  
-  Más información: [Registro nacional de plaguicidas no agrícolas - Ministerio de Sanidad](https://www.sanidad.gob.es/areas/sanidadAmbiental/biocidas/registro/regNacional/requisitos_nacional.htm)\n
-- Si se trata de un **biocida tipo 3** (higiene veterinaria con función biocida), es obligatoria la notificación a Sanidad de conformidad con la **Disposición Transitoria Segunda del RD 1054/2002** (no requiere ensayos de eficacia).  
-  Más información: [Notificación DT2 - Ministerio de Sanidad](https://www.sanidad.gob.es/areas/sanidadAmbiental/biocidas/registro/regPlaguicidas/dt2notificanuevo.htm)\n
-
-En todo caso, para los casos anteriores, una vez que las sustancias activas que formen parte del producto (sustancias biocidas) cuenten con Reglamento de Ejecución para los tipos de productos biocidas que se quieren defender, esos productos deberán solicitar su registro por procedimiento europeo, de conformidad con las exigencias del Reglamento (UE) 528/2012.
-
-En todo caso, si los productos que se deseen comercializar estén afectados o no por lo indicado anteriormente, son productos químicos peligrosos (mezclas o sustancias) quedarán afectados por la normativa de clasificación y etiquetado de mezclas y sustancias químicas, debiendo estar debidamente etiquetados, contar con ficha de datos de seguridad (FDS) y ser notificados a toxicología a través de un expediente PCN.
-
-Por tanto, tal y como recomiendan desde ASEMAZ, lo más conveniente es poneros en contacto con la autoridad competente correspondiente para que os puedan dar información detallada."""
-    ],
-    "vitamina a": [
-        """De acuerdo con el Reglamento 1223/2009, para cualquier producto cosmético que contenga las sustancias 'Retinol', 'Retinyl Acetate' o 'Retinyl Palmitate', la mención **“Este producto contiene vitamina A. Tenga en cuenta su ingesta diaria antes de utilizarlo”** es obligatoria. 
-Por tanto, la advertencia debe figurar literalmente en el etiquetado del producto.""",
-        
-        """Entendemos que esta advertencia pueda generar cierta confusión en el consumidor, pero modificar la redacción obligatoria no es una opción, ya que debe figurar exactamente con la redacción establecida en el Reglamento. 
-No obstante, y siempre bajo criterio del evaluador de seguridad del producto, puede añadirse una advertencia complementaria que aclare que el producto es de uso cosmético y no debe ingerirse."""
-    ],
-    "e metrologica": [
-        """Según el Real Decreto 1801/2008, la inclusión del símbolo "℮" en el etiquetado de los envases **no es obligatoria**.  
-El artículo 9.c) establece que los envases que cumplen con las modalidades de control estadístico de lotes especificadas en el decreto pueden llevar el símbolo "℮", lo que certifica que el envase cumple con las disposiciones del mismo.
-
-Si el símbolo "℮" ya está presente en el envase secundario, **no es necesario incluirlo también en el envase primario**, siempre y cuando se garantice que el envase primario cumple con los requisitos de control establecidos.  
-Sin embargo, es recomendable que la información sea clara y accesible para el consumidor, por lo que se sugiere mantener la coherencia en el etiquetado de ambos envases."""
-    ]
-}
+try:
+    kb = obtener_base_conocimiento(firma_fuentes())
+except FileNotFoundError as e:
+    st.error(f"❌ No se encontró el archivo '{e.filename}'. Ejecuta primero 'python generar_indice.py'.")
+    st.stop()
+except IndiceIncompatibleError as e:
+    st.error(f"❌ {e}")
+    st.stop()
+
+if not kb.nombres_pdf:
+    st.warning("⚠️ El índice no contiene PDFs. Ejecuta 'python generar_indice.py' con la carpeta de PDFs.")
 
 # ==============================================
-# RESPUESTAS DE REDIRECCIÓN PREDEFINIDAS
+# 5️⃣ FUNCIÓN PRINCIPAL (ver nucleo.Chatbot)
 # ==============================================
-REDIRECCIONES_PREDEFINIDAS = {
-    "internacional": {
-        "respuesta": """\
-Buenos días,
+chatbot = Chatbot(kb, client, cache_embeddings, cache_respuestas, trazas=registro_trazas)
 
-Para consultas relacionadas con terceros países pueden ayudaros mis compañeras del área internacional.  
-Lamentablemente, ellas aún no tienen acceso a la plataforma de Consultas Técnicas,  
-pero puedes escribirles a la siguiente dirección de correo electrónico:
 
-[stanpainternacional@stanpa.com](mailto:stanpainternacional@stanpa.com)
+async def responder_chatbot_async(pregunta, historial=None):
+    """Devuelve (respuesta, origen) con la respuesta ya completa."""
+    respuesta, preparada = await chatbot.responder(pregunta, historial=historial)
+    return respuesta, preparada.origen
 
-Espero haber sido de utilidad y si necesita alguna cosa más, estamos a su disposición.
 
-Reciba un cordial saludo,  
-Departamento Técnico.
-"""
-    },
-    "sostenibilidad": {
-        "respuesta": """\
-Buenos días,
+def responder_chatbot_stream(pregunta, mostrar_contexto=False, historial=None):
+    """Envoltorio síncrono para la interfaz: devuelve (trozos, origen), con
+    `trozos` un generador normal con el texto de la respuesta según se genera.
+    `historial` son los mensajes anteriores de la conversación."""
+    preparada = client.ejecutar(chatbot.preparar_respuesta(pregunta, historial=historial))
 
-En relación con tu consulta, lamentamos informarte que la responsable de Sostenibilidad,  
-quien podría ayudarte, no tiene acceso a la nueva plataforma de consultas técnicas.  
-No obstante, puedes dirigirte a ella a través del siguiente correo electrónico:
+    # 👇 Bloque para visualizar el contexto usado (Streamlit solo admite
+    # dibujar desde el hilo de la sesión, no desde el bucle del cliente)
+    if mostrar_contexto and preparada.contexto is not None:
+        with st.expander("📚 Fragmentos utilizados"):
+            for frag in preparada.contexto.fragmentos:
+                st.markdown(f"<pre>{frag[:1000]}</pre>", unsafe_allow_html=True)
 
-[lucia.jimenez@stanpa.com](mailto:lucia.jimenez@stanpa.com)
+    return client.iterar(preparada.trozos), preparada.origen
 
-Espero haber sido de utilidad y si necesita alguna cosa más, estamos a su disposición.
 
-Reciba un cordial saludo,  
-Departamento Técnico.
-"""
-    }
-}
+def responder_chatbot(pregunta, mostrar_contexto=False, historial=None):
+    """Devuelve (respuesta, origen) con la respuesta ya completa."""
+    trozos, origen = responder_chatbot_stream(pregunta, mostrar_contexto, historial)
+    return "".join(trozos), origen
 
-# ==============================================
-# 5️⃣ FUNCIÓN PRINCIPAL
-# ==============================================
-def responder_chatbot(pregunta, mostrar_contexto=False):
-    hora = datetime.now().hour
-    saludo = "Buenos días," if hora < 12 else "Buenas tardes,"
-    despedida = (
-        "<br><br>Espero haber sido de utilidad y si necesita alguna cosa más, estamos a su disposición.<br><br>"
-        "Reciba un cordial saludo,<br>"
-        "Departamento Técnico."
-    )
-
-    # 🔹 Limpieza y normalización de texto
-    pregunta_sin_acentos = quitar_acentos(pregunta.lower())
-    pregunta_sin_acentos = pregunta_sin_acentos.translate(str.maketrans('', '', string.punctuation))
-
-    # ======================================================
-    # 🔹 1️⃣ Detección de temas INTERNACIONALES
-    # ======================================================
-    palabras_internacionales = [
-        "exportar", "exportacion", "terceros paises", "fuera de la ue",
-        "suiza", "australia", "nueva zelanda", "eeuu", "ee uu", "china",
-        "reino unido", "panama", "canada", "japon", "corea",
-        "india", "brasil", "mexico"
-    ]
-
-    if any(re.search(rf'\b{p}\b', pregunta_sin_acentos) for p in palabras_internacionales):
-        return REDIRECCIONES_PREDEFINIDAS["internacional"]["respuesta"]
-
-    # ======================================================
-    # 🔹 2️⃣ Detección de temas de SOSTENIBILIDAD
-    # ======================================================
-    palabras_sostenibilidad = [
-        "sostenibilidad", "envase sostenible", "reciclaje", "reciclado",
-        "simbolos de contenedores", "contenedor", "etiqueta ambiental",
-        "huella de carbono", "ecodiseno", "packaging sostenible", "material reciclado"
-    ]
-
-    if any(re.search(rf'\b{p}\b', pregunta_sin_acentos) for p in palabras_sostenibilidad):
-        return REDIRECCIONES_PREDEFINIDAS["sostenibilidad"]["respuesta"]
-
-    # ======================================================
-    # 🔹 3️⃣ Temas específicos: Vitamina A
-    # ======================================================
-    if any(p in pregunta_sin_acentos for p in ["vitamina a", "retinol", "retinil"]):
-        texto = "\n\n".join(FRASES_POR_TEMA["vitamina a"])
-        return f"{saludo}\n\n{texto}\n\n{despedida}"
-
-    # ======================================================
-    # 🔹 4️⃣ Temas específicos: Cosmética para animales
-    # ======================================================
-    if any(p in pregunta_sin_acentos for p in [
-        "cosmetica animal", "cosmetica para animales", "higiene animal",
-        "cuidado animal", "cosmetica veterinaria", "productos para mascotas"
-    ]):
-        texto = FRASES_POR_TEMA["cosmetica para animales"][0]
-        return f"{saludo}\n\n{texto}\n\n{despedida}"
-
-    # ======================================================
-    # 🔹 5️⃣ Detección de “℮” metrológica
-    # ======================================================
-    if re.search(r'(℮|["“”\' ]?e["“”\' ]?[- ]?metrologic)', pregunta_sin_acentos) and "vitamina" not in pregunta_sin_acentos:
-        print("✅ Tema detectado: e metrológica")
-        texto_base = "\n\n".join(FRASES_POR_TEMA["e metrologica"])
-
-        # Si la consulta es más amplia, añade párrafo complementario
-        if re.search(r'(ademas|otra|tambien|aparte)', pregunta_sin_acentos):
-            prompt = f"""
-Eres un experto en legislación cosmética y etiquetado.
-La siguiente respuesta ya es correcta y está aprobada:
-
---- RESPUESTA BASE ---
-{texto_base}
-----------------------
-
-El usuario ha hecho una consulta más amplia:
-{pregunta}
-
-Redacta SOLO un párrafo adicional complementario (si procede),
-sin modificar ni repetir la respuesta base.
-Si no hay nada relevante que añadir, responde con una frase breve confirmando que la respuesta base es suficiente.
-"""
-            complemento = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2
-            ).choices[0].message.content.strip()
-            texto_final = f"{texto_base}\n\n{complemento}"
-        else:
-            texto_final = texto_base
-
-        return f"{saludo}\n\n{texto_final}\n\n{despedida}"
-
-    # ======================================================
-    # 🔹 6️⃣ Caso general: búsqueda por embeddings
-    # ======================================================
-    fragmentos = buscar_contexto(pregunta)
-
-    # 👇 Bloque para visualizar el contexto usado
-    if mostrar_contexto:
-        st.markdown("### 📚 Fragmentos utilizados:")
-        for frag in fragmentos:
-            st.markdown(f"<pre>{frag[:1000]}</pre>", unsafe_allow_html=True)
-
-    # Construir el contexto textual
-    contexto = "\n\n".join(fragmentos) if fragmentos else ""
-
-    prompt = f"""
-Eres un asistente técnico experto en legislación cosmética, biocidas y productos regulados.
-Redacta una respuesta formal, precisa y técnica, pero **no incluyas fórmulas de cortesía como 'Estimado/a' ni nombres del remitente.**
-Tampoco incluyas una firma con nombres personales; la respuesta debe cerrarse con 'Departamento Técnico.'
-Empieza la respuesta directamente tras el saludo y no incluyas saludos ni cierres redundantes.
-
-Contexto normativo: {contexto}
-Pregunta: {pregunta}
-"""
-    respuesta = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.1
-    ).choices[0].message.content.strip()
-
-    # ======================================================
-    # 🔹 7️⃣ Ajustes de formato
-    # ======================================================
-    if not respuesta.lower().startswith(("buenos días", "buenas tardes")):
-        respuesta = f"{saludo}\n\n{respuesta}"
-
-    for texto_final in ["departamento técnico", "reciba un cordial saludo"]:
-        if texto_final in respuesta.lower():
-            respuesta = respuesta[:respuesta.lower().rfind(texto_final)].strip()
-            break
-
-    respuesta = f"{respuesta}\n\n{despedida}"
-    return respuesta
+
+def pintar_en_streaming(trozos):
+    """Pinta la respuesta según llega, ya dentro de .chat-response, y la devuelve completa."""
+    hueco = st.empty()
+    partes, pintado = [], 0.0
+    for trozo in trozos:
+        partes.append(trozo)
+        if time.monotonic() - pintado >= INTERVALO_PINTADO:
+            hueco.markdown(render_html_markdown("".join(partes)), unsafe_allow_html=True)
+            pintado = time.monotonic()
+    respuesta = "".join(partes)
+    html = render_html_markdown(respuesta)
+    hueco.markdown(html, unsafe_allow_html=True)
+    return respuesta, html
 
 # ==============================================
 # 🖥️ INTERFAZ STREAMLIT
@@ -395,21 +169,72 @@ st.markdown("<hr>", unsafe_allow_html=True)
 
 if "historial" not in st.session_state:
     st.session_state.historial = []
+if "mensajes_visibles" not in st.session_state:
+    st.session_state.mensajes_visibles = VENTANA_HISTORIAL
+
+def mostrar_pregunta(texto):
+    st.markdown(f"<div class='chat-question'>🧴 <strong>Tú:</strong> {texto}</div>", unsafe_allow_html=True)
+
 
-for entrada in st.session_state.historial:
+# Solo se pintan los últimos mensajes; el HTML de cada respuesta se genera una
+# vez y se guarda con el mensaje, así cada re-ejecución no depende de la longitud
+historial = st.session_state.historial
+ocultos = max(0, len(historial) - st.session_state.mensajes_visibles)
+# (etiqueta fija: si cambiara con el número de ocultos, el clic se perdería)
+if ocultos and st.button("⬆️ Ver mensajes anteriores"):
+    st.session_state.mensajes_visibles += VENTANA_HISTORIAL
+    st.rerun()
+
+for entrada in historial[ocultos:]:
     if entrada["role"] == "user":
-        st.markdown(f"<div class='chat-question'>🧴 <strong>Tú:</strong> {entrada['content']}</div>", unsafe_allow_html=True)
+        mostrar_pregunta(entrada["content"])
     else:
-        st.markdown(render_html_markdown(entrada["content"]), unsafe_allow_html=True)
+        if "html" not in entrada:
+            entrada["html"] = render_html_markdown(entrada["content"])
+        st.markdown(entrada["html"], unsafe_allow_html=True)
+        if entrada.get("origen"):
+            st.caption(ETIQUETAS_ORIGEN[entrada["origen"]])
 
 pregunta = st.chat_input("Escribe tu consulta y pulsa Enter para enviar...")
 
 if pregunta:
-    st.session_state.historial.append({"role": "user", "content": pregunta})
+    historial.append({"role": "user", "content": pregunta})
+    mostrar_pregunta(pregunta)
     with st.spinner("Analizando consulta..."):
-        respuesta = responder_chatbot(pregunta, mostrar_contexto=True)
-    st.session_state.historial.append({"role": "assistant", "content": respuesta})
-    st.rerun()
+        trozos, origen = responder_chatbot_stream(
+            pregunta, mostrar_contexto=MOSTRAR_FRAGMENTOS, historial=historial[:-1]
+        )
+    # La respuesta se pinta según llega, sin volver a ejecutar la página
+    respuesta, html = pintar_en_streaming(trozos)
+    st.caption(ETIQUETAS_ORIGEN[origen])
+    historial.append({"role": "assistant", "content": respuesta, "html": html, "origen": origen})
+    del historial[:-MAX_MENSAJES]
+
+# ==============================================
+# 📈 PANEL DE ADMINISTRACIÓN (solo con PANEL_ADMIN=1)
+# ==============================================
+# Se dibuja al final para incluir la respuesta que se acaba de dar
+if os.getenv("PANEL_ADMIN") == "1":
+    with st.sidebar:
+        st.header("📈 Métricas")
+        percentiles = registro_trazas.percentiles()
+        if percentiles:
+            st.caption(f"Latencias (ms) de las últimas {max(p['n'] for p in percentiles.values())} respuestas")
+            st.dataframe(pd.DataFrame(percentiles).T.round(1))
+        else:
+            st.caption("Todavía no hay respuestas registradas.")
+        resumen = registro_trazas.resumen()
+        st.subheader("Peticiones")
+        st.json(resumen, expanded=False)
+        st.subheader("Cachés y enrutado")
+        st.json({
+            "embeddings": cache_embeddings.estadisticas(),
+            "respuestas": cache_respuestas.estadisticas(),
+            "temas": MOTOR.aciertos(),
+        }, expanded=False)
+        st.download_button(
+            "⬇️ Métricas Prometheus", registro_trazas.prometheus(), file_name="metrics.txt", mime="text/plain"
+        )
 
 st.markdown("<hr>", unsafe_allow_html=True)
 st.caption("🧠 Basado en el histórico de consultas internas y el modelo GPT-4o de OpenAI.")
\ No newline at end of file
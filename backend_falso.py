@@ -0,0 +1,96 @@
+# ==============================================
+# 🧪 Backend de OpenAI falso y determinista (sin red)
+# Para benchmarks y pruebas: mismos textos → mismos vectores y respuestas
+# ==============================================
+
+import asyncio
+import hashlib
+import re
+from collections import Counter
+
+import numpy as np
+
+from cliente_openai import CONCURRENCIA, ClienteOpenAI
+
+DIMENSION = 1536  # la de text-embedding-3-small, para poder usar un índice real
+RE_PALABRA = re.compile(r"\w+")
+RE_TOKEN = re.compile(r"\S+\s*")
+
+
+def vector_falso(texto, dimension=DIMENSION):
+    """Embedding determinista: bolsa de palabras con cada palabra en una posición por hash.
+
+    Textos con palabras en común tienen similitud coseno alta, como con un
+    modelo real, así que los umbrales de búsqueda siguen teniendo sentido.
+    """
+    vector = np.zeros(dimension, dtype=np.float32)
+    for palabra in RE_PALABRA.findall(texto.lower()):
+        vector[int.from_bytes(hashlib.md5(palabra.encode("utf-8")).digest()[:4], "little") % dimension] += 1
+    return vector
+
+
+def uso_falso(prompt, texto):
+    """Tokens de entrada y salida aproximados por palabras, como los que informa la API."""
+    return {"prompt_tokens": len(RE_TOKEN.findall(prompt)), "completion_tokens": len(RE_TOKEN.findall(texto))}
+
+
+def respuesta_falsa(prompt):
+    """Texto de chat determinista que menciona el final de la pregunta."""
+    pregunta = prompt.strip().splitlines()[-1] if prompt.strip() else ""
+    return (
+        f"Respuesta de prueba generada sin conexión para: {pregunta[:200]}\n\n"
+        "Reciba un cordial saludo,\nDepartamento Técnico."
+    )
+
+
+class ClienteFalso(ClienteOpenAI):
+    """ClienteOpenAI que responde en el propio proceso con `vector_falso` y `respuesta_falsa`.
+
+    Conserva el bucle, el semáforo y `ejecutar`/`iterar` del cliente real;
+    `latencia` y `latencia_token` simulan la espera de la API. `llamadas`
+    cuenta las peticiones por tipo.
+    """
+
+    def __init__(self, dimension=DIMENSION, latencia=0.0, latencia_token=0.0, concurrencia=CONCURRENCIA):
+        self.dimension = dimension
+        self.latencia = latencia
+        self.latencia_token = latencia_token
+        self.llamadas = Counter()
+        super().__init__(concurrencia=concurrencia)
+
+    async def _iniciar(self, api_key, base_url, concurrencia):
+        self._api = None
+        self._semaforo = asyncio.Semaphore(concurrencia)
+
+    async def _esperar(self, tipo):
+        self.llamadas[tipo] += 1
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+
+    async def embedding(self, texto, modelo, limite=None):
+        async with self._semaforo:
+            await asyncio.wait_for(self._esperar("embeddings"), limite)
+        return vector_falso(texto, self.dimension).tolist()
+
+    async def embeddings(self, textos, modelo):
+        async with self._semaforo:
+            await self._esperar("embeddings")
+        return [vector_falso(t, self.dimension).tolist() for t in textos]
+
+    async def completar(self, prompt, temperatura, modelo=None):
+        async with self._semaforo:
+            await self._esperar("chat")
+        return respuesta_falsa(prompt)
+
+    async def completar_stream(self, prompt, temperatura, modelo=None, uso=None):
+        # Como el cliente real: el hueco solo se ocupa hasta que empieza el stream
+        async with self._semaforo:
+            await self._esperar("chat")
+        texto = respuesta_falsa(prompt)
+        for token in RE_TOKEN.findall(texto):
+            if self.latencia_token:
+                await asyncio.sleep(self.latencia_token)
+            yield token
+        if uso is not None:
+            tokens = uso_falso(prompt, texto)
+            uso.update(entrada=tokens["prompt_tokens"], salida=tokens["completion_tokens"])
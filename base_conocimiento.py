@@ -0,0 +1,213 @@
+# ==============================================
+# 📚 Base de conocimiento compartida
+# Se construye una vez por proceso y se comparte entre sesiones
+# ==============================================
+
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+from busqueda import MotorBusqueda
+from indice import (
+    DIRECTORIO_INDICE,
+    FICHERO_MANIFIESTO,
+    FUENTE_EXCEL,
+    IndiceIncompatibleError,
+    cargar_indice,
+    listar_pdfs,
+)
+from normalizacion import normalizar_embedding, normalizar_texto
+
+RUTA_EXCEL = "conversaciones_revisando.xlsx"
+CARPETA_PDFS = "."
+# "float32" (exacto), "float16" o "int8" (cuantizado con re-puntuación exacta)
+MODO_BUSQUEDA = os.getenv("MODO_BUSQUEDA", "float32")
+
+
+@dataclass(frozen=True)
+class BaseConocimiento:
+    """Datos de solo lectura (Excel + índice de embeddings) usados para responder.
+
+    Es inmutable: las colecciones son tuplas y las matrices de embeddings
+    son vistas de solo lectura del índice mapeado en memoria, de modo que
+    puede compartirse sin riesgo entre sesiones y reruns de Streamlit.
+    `lexico` es el índice BM25 de las mismas filas (None si el índice se
+    generó sin él); sus stopwords son las de `stop_words`.
+    """
+    consultas: tuple
+    respuestas: tuple
+    consultas_norm: tuple
+    pares: tuple
+    indice_exacto: MappingProxyType
+    emb_consultas: np.ndarray
+    emb_pdfs: np.ndarray
+    busqueda_consultas: MotorBusqueda
+    busqueda_pdfs: MotorBusqueda
+    fragmentos_pdf: pd.DataFrame
+    nombres_pdf: tuple
+    indice: object
+    lexico: object
+    stop_words: frozenset
+    firma: tuple
+    tiempos: MappingProxyType
+
+    @property
+    def version(self):
+        """Identifica el contenido indexado: cambia al regenerar el índice."""
+        m = self.indice.manifiesto
+        fuentes = json.dumps(m["fuentes"], sort_keys=True)
+        return hashlib.sha256(f"{m['version']}|{m['modelo']}|{m['creado']}|{fuentes}".encode()).hexdigest()[:16]
+
+    def buscar_exacta(self, pregunta):
+        """Filas de `pares` cuya pregunta coincide con `pregunta` en forma canónica.
+
+        Es una consulta a un diccionario: el coste no depende del tamaño del Excel.
+        """
+        return self.indice_exacto.get(normalizar_texto(pregunta), ())
+
+    def texto_fragmento(self, i):
+        """Texto del i-ésimo fragmento de PDF, leído del índice bajo demanda."""
+        return self.indice.texto(len(self.pares) + i)
+
+
+def firma_fuentes(ruta_excel=RUTA_EXCEL, directorio_indice=DIRECTORIO_INDICE, carpeta_pdfs=CARPETA_PDFS):
+    """Devuelve (ruta, mtime) de cada fuente; sirve para invalidar la caché.
+
+    Si un fichero no existe su mtime es None, así que crearlo más tarde
+    también cambia la firma.
+    """
+    rutas = [ruta_excel, os.path.join(directorio_indice, FICHERO_MANIFIESTO), *listar_pdfs(carpeta_pdfs)]
+    firma = []
+    for ruta in rutas:
+        try:
+            firma.append((ruta, os.stat(ruta).st_mtime_ns))
+        except FileNotFoundError:
+            firma.append((ruta, None))
+    return tuple(firma)
+
+
+@contextmanager
+def _cronometrar(tiempos, etapa):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos[etapa] = time.perf_counter() - inicio
+
+
+def leer_pares(ruta_excel=RUTA_EXCEL):
+    """Lee el Excel y devuelve (consultas, respuestas) en el orden del fichero."""
+    df = pd.read_excel(ruta_excel)
+    df.columns = df.columns.str.strip().str.lower()
+    roles = df["role"].str.lower()
+    consultas = df[roles == "user"]["content"].tolist()
+    respuestas = df[roles == "assistant"]["content"].tolist()
+    return consultas, respuestas
+
+
+def construir_indice_exacto(consultas):
+    """Diccionario forma canónica de la pregunta -> filas de `pares` (en orden)."""
+    indice = {}
+    for fila, consulta in enumerate(consultas):
+        indice.setdefault(normalizar_texto(consulta), []).append(fila)
+    return MappingProxyType({clave: tuple(filas) for clave, filas in indice.items()})
+
+
+def construir_base_conocimiento(
+    consultas,
+    respuestas,
+    indice,
+    modo_busqueda=MODO_BUSQUEDA,
+    stop_words=None,
+    firma=(),
+    tiempos=None,
+):
+    """Monta la base de conocimiento a partir de los pares y un índice ya cargado.
+
+    Lanza IndiceIncompatibleError si el índice no tiene una fila por consulta.
+    """
+    tiempos = {} if tiempos is None else tiempos
+
+    with _cronometrar(tiempos, "pares"):
+        # Texto de cada consulta tal y como se embebió en el índice
+        consultas_norm = tuple(normalizar_embedding(c) for c in consultas)
+        pares = tuple(zip(consultas_norm, respuestas))
+
+    with _cronometrar(tiempos, "indice_exacto"):
+        indice_exacto = construir_indice_exacto(consultas)
+
+    # Las filas del Excel van primero en el índice y después los PDFs:
+    # ambas matrices son vistas del mismo fichero mapeado, sin copias.
+    n_excel = int(indice.manifiesto["filas_por_tipo"][FUENTE_EXCEL])
+    if n_excel != len(pares):
+        raise IndiceIncompatibleError(
+            f"El índice tiene {n_excel} consultas y el Excel {len(pares)}."
+        )
+    emb_consultas = indice.embeddings[:n_excel]
+    emb_pdfs = indice.embeddings[n_excel:]
+    fragmentos_pdf = indice.metadatos.iloc[n_excel:].reset_index(drop=True)
+    nombres_pdf = tuple(fragmentos_pdf["fuente"].unique().tolist())
+
+    with _cronometrar(tiempos, "busqueda"):
+        normalizados = bool(indice.manifiesto.get("normalizados"))
+        busqueda_consultas = MotorBusqueda(emb_consultas, modo=modo_busqueda, normalizados=normalizados)
+        busqueda_pdfs = MotorBusqueda(emb_pdfs, modo=modo_busqueda, normalizados=normalizados)
+    if stop_words is None:
+        stop_words = indice.lexico.stop_words if indice.lexico is not None else ()
+
+    return BaseConocimiento(
+        consultas=tuple(consultas),
+        respuestas=tuple(respuestas),
+        consultas_norm=consultas_norm,
+        pares=pares,
+        indice_exacto=indice_exacto,
+        emb_consultas=emb_consultas,
+        emb_pdfs=emb_pdfs,
+        busqueda_consultas=busqueda_consultas,
+        busqueda_pdfs=busqueda_pdfs,
+        fragmentos_pdf=fragmentos_pdf,
+        nombres_pdf=nombres_pdf,
+        indice=indice,
+        lexico=indice.lexico,
+        stop_words=frozenset(stop_words),
+        firma=firma,
+        tiempos=MappingProxyType(tiempos),
+    )
+
+
+def cargar_base_conocimiento(
+    ruta_excel=RUTA_EXCEL,
+    directorio_indice=DIRECTORIO_INDICE,
+    carpeta_pdfs=CARPETA_PDFS,
+    modo_busqueda=MODO_BUSQUEDA,
+):
+    """Carga Excel e índices (embeddings y léxico), midiendo cada etapa.
+
+    Lanza FileNotFoundError si faltan el Excel o el índice, e
+    IndiceIncompatibleError si el índice no corresponde al Excel/PDFs actuales.
+    """
+    firma = firma_fuentes(ruta_excel, directorio_indice, carpeta_pdfs)
+    tiempos = {}
+    inicio_total = time.perf_counter()
+
+    with _cronometrar(tiempos, "excel"):
+        consultas, respuestas = leer_pares(ruta_excel)
+
+    with _cronometrar(tiempos, "indice"):
+        indice = cargar_indice(directorio_indice, ruta_excel, listar_pdfs(carpeta_pdfs))
+
+    # Las stopwords vienen guardadas en el índice léxico: no hace falta NLTK al arrancar
+    kb = construir_base_conocimiento(consultas, respuestas, indice, modo_busqueda, firma=firma, tiempos=tiempos)
+
+    tiempos["total"] = time.perf_counter() - inicio_total
+    detalle = ", ".join(f"{etapa}: {seg:.2f}s" for etapa, seg in tiempos.items())
+    print(f"✅ Base de conocimiento cargada ({len(kb.pares)} pares, {len(kb.fragmentos_pdf)} fragmentos "
+          f"de {len(kb.nombres_pdf)} PDFs) — {detalle}")
+    return kb
@@ -0,0 +1,69 @@
+# ==============================================
+# ⏱️ Micro-benchmark de la coincidencia exacta
+# Uso: python -m benchmarks.busqueda_exacta
+# ==============================================
+
+import random
+import time
+
+from base_conocimiento import construir_indice_exacto
+from normalizacion import normalizar_embedding, normalizar_texto
+
+TAMANOS = (1_000, 10_000, 100_000)
+CONSULTAS = 2_000
+
+TEMAS = ["etiquetado", "notificación CPNP", "conservantes", "protección solar", "niños", "℮ metrológica"]
+
+
+def corpus_sintetico(n, semilla=0):
+    rng = random.Random(semilla)
+    return [
+        f"¿Está permitido usar la sustancia Nº {i} en {rng.choice(TEMAS)} (Reglamento 1223/2009)?"
+        for i in range(n)
+    ]
+
+
+def variante(pregunta, rng):
+    """Misma pregunta con cambios triviales: espacios, comillas, mayúsculas, puntuación."""
+    return rng.choice([
+        lambda p: f"  {p.upper()}  ",
+        lambda p: p.replace("sustancia", "“sustancia”"),
+        lambda p: p.replace(" ", "   ").rstrip("?"),
+        lambda p: p.replace("¿", "").replace("?", "."),
+    ])(pregunta)
+
+
+def _por_consulta(funcion, consultas):
+    inicio = time.perf_counter()
+    for consulta in consultas:
+        funcion(consulta)
+    return (time.perf_counter() - inicio) / len(consultas) * 1e6
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'filas':>8} | {'indice (µs)':>12} | {'bucle (µs)':>12} | aciertos variantes")
+    for n in TAMANOS:
+        corpus = corpus_sintetico(n)
+        indice = construir_indice_exacto(corpus)
+        consultas = [variante(rng.choice(corpus), rng) for _ in range(CONSULTAS // 2)]
+        consultas += [f"pregunta inexistente {i}" for i in range(CONSULTAS // 2)]
+
+        t_indice = _por_consulta(lambda c: indice.get(normalizar_texto(c), ()), consultas)
+
+        # Búsqueda anterior: recorrer todos los pares comparando texto normalizado
+        normalizadas = [normalizar_embedding(c) for c in corpus]
+
+        def bucle(consulta):
+            objetivo = normalizar_embedding(consulta)
+            for preg in normalizadas:
+                if normalizar_embedding(preg) == objetivo:
+                    return preg
+
+        t_bucle = _por_consulta(bucle, rng.sample(consultas, max(5, 100_000 // n)))
+        aciertos = sum(bool(indice.get(normalizar_texto(c))) for c in consultas[:CONSULTAS // 2])
+        print(f"{n:>8} | {t_indice:>12.2f} | {t_bucle:>12.0f} | {aciertos}/{CONSULTAS // 2}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# ==============================================
+# 🧭 Paridad del enrutado con la versión original de la app
+# Uso: python -m benchmarks.paridad_enrutado [conversaciones_revisando.xlsx]
+# Termina con código 1 si alguna pregunta del Excel cambia de ruta
+# ==============================================
+
+import argparse
+import re
+import string
+import sys
+
+from base_conocimiento import RUTA_EXCEL, leer_pares
+from enrutado import MOTOR
+from normalizacion import normalizar_enrutado, quitar_acentos
+
+# Reglas de responder_chatbot antes de la tabla de enrutado, en su orden
+PALABRAS_ORIGINALES = (
+    ("internacional", (
+        "exportar", "exportacion", "terceros paises", "fuera de la ue",
+        "suiza", "australia", "nueva zelanda", "eeuu", "ee uu", "china",
+        "reino unido", "panama", "canada", "japon", "corea",
+        "india", "brasil", "mexico",
+    )),
+    ("sostenibilidad", (
+        "sostenibilidad", "envase sostenible", "reciclaje", "reciclado",
+        "simbolos de contenedores", "contenedor", "etiqueta ambiental",
+        "huella de carbono", "ecodiseno", "packaging sostenible", "material reciclado",
+    )),
+)
+SUBCADENAS_ORIGINALES = (
+    ("vitamina a", ("vitamina a", "retinol", "retinil")),
+    ("cosmetica para animales", (
+        "cosmetica animal", "cosmetica para animales", "higiene animal",
+        "cuidado animal", "cosmetica veterinaria", "productos para mascotas",
+    )),
+)
+RE_E_ORIGINAL = re.compile(r'(℮|["“”\' ]?e["“”\' ]?[- ]?metrologic)')
+
+
+def ruta_original(pregunta):
+    """Tema que elegía la versión original para `pregunta`, o None."""
+    texto = quitar_acentos(pregunta.lower()).translate(str.maketrans("", "", string.punctuation))
+    for tema, palabras in PALABRAS_ORIGINALES:
+        if any(re.search(rf"\b{p}\b", texto) for p in palabras):
+            return tema
+    for tema, subcadenas in SUBCADENAS_ORIGINALES:
+        if any(s in texto for s in subcadenas):
+            return tema
+    if RE_E_ORIGINAL.search(texto) and "vitamina" not in texto:
+        return "e metrologica"
+    return None
+
+
+def ruta_actual(pregunta):
+    ruta = MOTOR.enrutar(normalizar_enrutado(pregunta))
+    return ruta.tema if ruta else None
+
+
+def diferencias(preguntas):
+    """(pregunta, ruta original, ruta actual) de las preguntas que cambian de ruta."""
+    cambios = []
+    for pregunta in preguntas:
+        pregunta = str(pregunta)
+        antes, ahora = ruta_original(pregunta), ruta_actual(pregunta)
+        if antes != ahora:
+            cambios.append((pregunta, antes, ahora))
+    return cambios
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el enrutado actual con el original sobre el Excel.")
+    parser.add_argument("excel", nargs="?", default=RUTA_EXCEL)
+    args = parser.parse_args()
+
+    consultas, _ = leer_pares(args.excel)
+    cambios = diferencias(consultas)
+    for pregunta, antes, ahora in cambios:
+        print(f"❌ {antes} → {ahora}: {pregunta[:120]!r}")
+    if cambios:
+        print(f"⚠️ {len(cambios)} de {len(consultas)} preguntas cambian de ruta")
+        sys.exit(1)
+    print(f"✅ Las {len(consultas)} preguntas del Excel mantienen su ruta")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+# ==============================================
+# ⏱️ Benchmark por etapas de la respuesta, sin red ni Streamlit
+# Uso: python -m benchmarks.pipeline [--tamanos 1000 10000] [--referencia anterior.json]
+# ==============================================
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from backend_falso import ClienteFalso, vector_falso
+from base_conocimiento import construir_base_conocimiento
+from benchmarks.busqueda_exacta import corpus_sintetico, variante
+from enrutado import MOTOR
+from indice import FUENTE_EXCEL, MODELO_EMBEDDINGS, cargar_indice, escribir_indice, hashes_fuentes
+from lexico import IndiceLexico, stop_words_espanol
+from normalizacion import normalizar_embedding, normalizar_enrutado, normalizar_texto
+from nucleo import TOP_K, TOP_K_PDF, Chatbot, construir_prompt
+
+TAMANOS = (1_000, 10_000, 100_000)
+CONSULTAS = 500
+CONSULTAS_E2E = 200
+# Dimensión reducida para que el corpus de 100k quepa holgado en memoria
+DIMENSION = 256
+# Un fragmento de PDF por cada 10 filas del Excel
+FRAGMENTOS_POR_FILA = 0.1
+SALIDA = os.path.join("benchmarks", "resultados", "pipeline.json")
+# Una etapa se marca como regresión si su p50 empeora más que esto
+TOLERANCIA = 0.2
+
+PREGUNTAS_ENRUTADAS = [
+    "¿Podemos exportar este champú a China?",
+    "¿Qué símbolos de contenedores hay que poner en el envase?",
+    "¿Es obligatoria la advertencia de vitamina A con retinol?",
+    "¿Un champú para mascotas es cosmética para animales?",
+    "¿Es obligatorio el símbolo ℮ en el envase primario?",
+]
+
+
+def construir_kb(directorio, n, dimension=DIMENSION, semilla=0):
+    """Base de conocimiento sintética de `n` pares, con su índice (y el léxico) escrito en `directorio`."""
+    rng = random.Random(semilla)
+    consultas = corpus_sintetico(n, semilla)
+    respuestas = [f"Respuesta sintética a la consulta {i}." for i in range(n)]
+    fragmentos = [
+        f"Artículo {i}. Requisitos de {rng.choice(['etiquetado', 'seguridad', 'notificación'])} "
+        f"aplicables a la sustancia Nº {rng.randrange(n)} según el Reglamento 1223/2009."
+        for i in range(int(n * FRAGMENTOS_POR_FILA))
+    ]
+
+    textos_embebidos = [normalizar_embedding(c) for c in consultas] + [normalizar_embedding(f) for f in fragmentos]
+    embeddings = np.vstack([vector_falso(t, dimension) for t in textos_embebidos])
+    metadatos = pd.DataFrame(
+        [{"fuente": FUENTE_EXCEL, "fila": i, "pagina": 0, "pagina_fin": 0, "seccion": ""} for i in range(n)]
+        + [{"fuente": "sintetico.pdf", "fila": i, "pagina": 1 + i // 5, "pagina_fin": 1 + i // 5, "seccion": ""}
+           for i in range(len(fragmentos))]
+    )
+
+    # El índice se valida contra el hash de su Excel: basta un fichero fijo
+    ruta_excel = os.path.join(directorio, "sintetico.xlsx")
+    with open(ruta_excel, "wb") as f:
+        f.write(b"sintetico")
+    ruta_indice = os.path.join(directorio, "indice")
+    escribir_indice(
+        ruta_indice, embeddings, metadatos, consultas + fragmentos,
+        {
+            "modelo": MODELO_EMBEDDINGS,
+            "fuentes": hashes_fuentes(ruta_excel, []),
+            "filas_por_tipo": {FUENTE_EXCEL: n, "pdf": len(fragmentos)},
+        },
+        lexico=IndiceLexico.construir(
+            [f"{c}\n{r}" for c, r in zip(consultas, respuestas)] + fragmentos, stop_words_espanol()
+        ),
+    )
+    return construir_base_conocimiento(consultas, respuestas, cargar_indice(ruta_indice, ruta_excel, []))
+
+
+def preguntas_de_prueba(kb, n, semilla=1):
+    """Mezcla de variantes de preguntas del Excel, preguntas nuevas y temas enrutados."""
+    rng = random.Random(semilla)
+    preguntas = []
+    for i in range(n):
+        tipo = i % 4
+        if tipo == 0:
+            preguntas.append(variante(rng.choice(kb.consultas), rng))
+        elif tipo == 1:
+            preguntas.append(rng.choice(PREGUNTAS_ENRUTADAS))
+        else:
+            preguntas.append(f"¿Qué requisitos de etiquetado tiene la sustancia Nº {rng.randrange(10**6)} en niños?")
+    return preguntas
+
+
+def _medir(funcion, entradas):
+    """Tiempos en segundos de `funcion(entrada)` para cada entrada, y el total."""
+    tiempos = []
+    inicio_total = time.perf_counter()
+    for entrada in entradas:
+        inicio = time.perf_counter()
+        funcion(entrada)
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos, time.perf_counter() - inicio_total
+
+
+def _resumen(tiempos, total):
+    ms = np.asarray(tiempos) * 1000
+    return {
+        "n": len(tiempos),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "por_segundo": round(len(tiempos) / total, 1) if total else None,
+    }
+
+
+def medir_etapas(kb, cliente, n_consultas=CONSULTAS, n_e2e=CONSULTAS_E2E):
+    """p50/p95 y rendimiento de cada etapa, y la huella de las decisiones tomadas."""
+    preguntas = preguntas_de_prueba(kb, n_consultas)
+    enrutables = [normalizar_enrutado(p) for p in preguntas]
+    vectores = [vector_falso(normalizar_embedding(p), kb.emb_consultas.shape[1]) for p in preguntas]
+    bot = Chatbot(kb, cliente)
+
+    etapas = {
+        "normalizacion": _medir(
+            lambda p: (normalizar_texto(p), normalizar_enrutado(p), normalizar_embedding(p)), preguntas
+        ),
+        "enrutado": _medir(lambda c: MOTOR.detectar(c, contar=False), enrutables),
+        "exacta": _medir(kb.buscar_exacta, preguntas),
+        "vectorial": _medir(
+            lambda v: (kb.busqueda_consultas.buscar(v, TOP_K), kb.busqueda_pdfs.buscar(v, TOP_K_PDF)), vectores
+        ),
+        "lexica": _medir(bot.buscar_lexico, preguntas),
+    }
+    # El prompt se monta con el contexto real de cada pregunta (recuperación fuera del cronómetro)
+    with contextlib.redirect_stdout(io.StringIO()):
+        contextos = [cliente.ejecutar(bot.buscar_contexto(p)) for p in preguntas]
+        etapas["prompt"] = _medir(lambda par: construir_prompt(par[0], par[1].fragmentos), zip(preguntas, contextos))
+        etapas["extremo_a_extremo"] = _medir(lambda p: cliente.ejecutar(bot.responder(p)), preguntas[:n_e2e])
+        # Huella de ruta, origen y fila elegidos: cambia si cambia el comportamiento
+        decisiones = []
+        for pregunta in preguntas[:n_e2e]:
+            preparada = cliente.ejecutar(bot.preparar_respuesta(pregunta))
+            fila = None if preparada.contexto is None else preparada.contexto.fila
+            decisiones.append([preparada.ruta, preparada.origen, fila])
+            cliente.ejecutar(preparada.trozos.aclose())
+
+    resultado = {etapa: _resumen(*medida) for etapa, medida in etapas.items()}
+    resultado["huella_decisiones"] = hashlib.sha256(json.dumps(decisiones).encode()).hexdigest()[:16]
+    return resultado
+
+
+def _commit_base():
+    """Commit sobre el que se mide, con "-dirty" si hay cambios sin confirmar.
+
+    Un resultado que se versiona se mide antes de confirmarlo: este es el
+    commit padre del que lo guarda, no el suyo.
+    """
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty", "--abbrev=7"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual, referencia, tolerancia=TOLERANCIA):
+    """Líneas con las etapas cuyo p50 empeora más de `tolerancia` o cuya huella cambia."""
+    avisos = []
+    for tamano, etapas in actual["resultados"].items():
+        anteriores = referencia.get("resultados", {}).get(tamano)
+        if not anteriores:
+            continue
+        if etapas["huella_decisiones"] != anteriores.get("huella_decisiones"):
+            avisos.append(f"{tamano}: cambian las decisiones de enrutado/recuperación")
+        for etapa, medida in etapas.items():
+            anterior = anteriores.get(etapa)
+            if isinstance(medida, dict) and anterior and medida["p50_ms"] > anterior["p50_ms"] * (1 + tolerancia):
+                avisos.append(
+                    f"{tamano} {etapa}: p50 {anterior['p50_ms']:.3f} → {medida['p50_ms']:.3f} ms"
+                )
+    return avisos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por etapas con corpus sintéticos y backend falso.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS)
+    parser.add_argument("--consultas", type=int, default=CONSULTAS)
+    parser.add_argument("--salida", default=SALIDA)
+    parser.add_argument("--referencia", help="JSON de una ejecución anterior con el que comparar")
+    args = parser.parse_args()
+
+    # Se lee antes de escribir: la referencia puede ser el mismo fichero de salida
+    referencia = None
+    if args.referencia:
+        with open(args.referencia, encoding="utf-8") as f:
+            referencia = json.load(f)
+
+    cliente = ClienteFalso(dimension=DIMENSION)
+    resultados = {}
+    try:
+        for n in args.tamanos:
+            with tempfile.TemporaryDirectory() as directorio:
+                inicio = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    kb = construir_kb(directorio, n)
+                print(f"📚 Corpus de {n} filas creado en {time.perf_counter() - inicio:.1f}s")
+                resultados[str(n)] = medir_etapas(kb, cliente, args.consultas, min(CONSULTAS_E2E, args.consultas))
+                del kb  # libera el mmap antes de borrar el directorio
+
+            print(f"{'etapa':>18} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'por s':>9}")
+            for etapa, medida in resultados[str(n)].items():
+                if isinstance(medida, dict):
+                    print(f"{etapa:>18} | {medida['p50_ms']:>9.3f} | {medida['p95_ms']:>9.3f} | {medida['por_segundo']:>9}")
+    finally:
+        cliente.cerrar()
+
+    informe = {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit_base": _commit_base(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "maquina": platform.machine(),
+        "dimension": DIMENSION,
+        "resultados": resultados,
+    }
+    os.makedirs(os.path.dirname(args.salida) or ".", exist_ok=True)
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, ensure_ascii=False, indent=2)
+    print(f"💾 Resultados guardados en '{args.salida}'")
+
+    if referencia is not None:
+        avisos = comparar(informe, referencia)
+        for aviso in avisos:
+            print(f"⚠️ {aviso}")
+        if not avisos:
+            print("✅ Sin regresiones respecto a la referencia")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# ==============================================
+# 🔎 Búsqueda vectorial top-k
+# Vectores normalizados una vez + producto matricial + argpartition
+# ==============================================
+
+import numpy as np
+
+MODOS = ("float32", "float16", "int8")
+# Filas que se descuantizan a la vez en los modos cuantizados (caben en caché)
+TAM_BLOQUE = 2048
+# En modo cuantizado se re-puntúan exactamente k * FACTOR_CANDIDATOS candidatos
+FACTOR_CANDIDATOS = 4
+
+
+def normalizar_filas(matriz):
+    """Copia float32 de `matriz` con cada fila de norma 1 (las filas nulas quedan a 0)."""
+    matriz = np.asarray(matriz, dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+    return matriz / np.where(normas == 0, 1, normas)
+
+
+def top_k(puntuaciones, k):
+    """Índices y puntuaciones de los k mayores valores de cada fila, de mayor a menor.
+
+    Usa argpartition (O(N)) y solo ordena los k elegidos.
+    """
+    k = min(k, puntuaciones.shape[1])
+    if k == 0:
+        vacio = np.empty((puntuaciones.shape[0], 0))
+        return vacio.astype(np.intp), vacio
+    candidatos = np.argpartition(puntuaciones, -k, axis=1)[:, -k:]
+    valores = np.take_along_axis(puntuaciones, candidatos, axis=1)
+    orden = np.argsort(-valores, axis=1)
+    return np.take_along_axis(candidatos, orden, axis=1), np.take_along_axis(valores, orden, axis=1)
+
+
+class MotorBusqueda:
+    """Similitud coseno top-k sobre una matriz de embeddings.
+
+    En modo "float32" cada búsqueda es un único producto matricial (una GEMM
+    para un lote de preguntas) contra los vectores normalizados. Si la matriz
+    ya es float32 con filas de norma 1 (`normalizados`, como en los índices
+    de generar_indice) se usa tal cual, sin copia: con el fichero mapeado no
+    ocupa RAM propia. Si no, se guarda una copia normalizada en memoria
+    (4 bytes por componente). En los modos "float16" e "int8" guarda una copia cuantizada
+    (1/2 o 1/4 de memoria), preselecciona candidatos con ella y los vuelve a
+    puntuar de forma exacta leyendo solo esas filas de la matriz original,
+    que puede ser el fichero mapeado del índice.
+    """
+
+    def __init__(self, matriz, modo="float32", factor_candidatos=FACTOR_CANDIDATOS, normalizados=False):
+        if modo not in MODOS:
+            raise ValueError(f"Modo de búsqueda desconocido: {modo!r} (opciones: {', '.join(MODOS)})")
+        self.modo = modo
+        self.factor_candidatos = factor_candidatos
+        self._original = matriz
+        self._normas = None
+        self._escalas = None
+
+        if modo == "float32" and normalizados and matriz.dtype == np.float32:
+            self._vectores = matriz
+        elif modo == "float32":
+            self._vectores = normalizar_filas(matriz)
+        else:
+            # Se cuantiza por bloques para no materializar la matriz completa en float32
+            n = len(matriz)
+            self._vectores = np.empty(matriz.shape, dtype=np.float16 if modo == "float16" else np.int8)
+            self._normas = np.empty(n, dtype=np.float32)
+            if modo == "int8":
+                self._escalas = np.empty((n, 1), dtype=np.float32)
+            for inicio in range(0, n, TAM_BLOQUE):
+                tramo = slice(inicio, inicio + TAM_BLOQUE)
+                bloque = np.asarray(matriz[tramo], dtype=np.float32)
+                normas = np.linalg.norm(bloque, axis=1)
+                self._normas[tramo] = normas
+                bloque = bloque / np.where(normas == 0, 1, normas)[:, None]
+                if modo == "float16":
+                    self._vectores[tramo] = bloque
+                else:
+                    # Escala por fila para aprovechar todo el rango de int8
+                    maximos = np.abs(bloque).max(axis=1, keepdims=True)
+                    escalas = np.where(maximos == 0, 1, maximos) / 127
+                    self._escalas[tramo] = escalas
+                    self._vectores[tramo] = np.round(bloque / escalas)
+        for array in (self._vectores, self._escalas, self._normas):
+            if array is not None:
+                array.setflags(write=False)
+
+    def __len__(self):
+        return len(self._vectores)
+
+    @property
+    def nbytes(self):
+        """Bytes de los vectores de búsqueda (del fichero mapeado si se usan sin copia)."""
+        return sum(a.nbytes for a in (self._vectores, self._escalas, self._normas) if a is not None)
+
+    def _puntuar(self, consultas):
+        """Similitudes aproximadas (o exactas en float32) de un lote contra todas las filas."""
+        if self.modo == "float32":
+            return consultas @ self._vectores.T
+        puntuaciones = np.empty((len(consultas), len(self._vectores)), dtype=np.float32)
+        for inicio in range(0, len(self._vectores), TAM_BLOQUE):
+            bloque = self._vectores[inicio:inicio + TAM_BLOQUE].astype(np.float32)
+            if self._escalas is not None:
+                bloque *= self._escalas[inicio:inicio + TAM_BLOQUE]
+            puntuaciones[:, inicio:inicio + TAM_BLOQUE] = consultas @ bloque.T
+        return puntuaciones
+
+    def _repuntuar(self, consultas, candidatos):
+        """Similitud exacta de cada consulta con sus candidatos, leyendo la matriz original."""
+        unicos, inversa = np.unique(candidatos, return_inverse=True)
+        filas = np.asarray(self._original[unicos], dtype=np.float32)
+        normas = self._normas[unicos]
+        exactas = (consultas @ filas.T) / np.where(normas == 0, 1, normas)
+        return np.take_along_axis(exactas, inversa.reshape(candidatos.shape), axis=1)
+
+    def similitudes_filas(self, consulta, filas):
+        """Similitud coseno exacta de un vector con las filas indicadas (p. ej. candidatos léxicos)."""
+        consulta = normalizar_filas(np.atleast_2d(np.asarray(consulta, dtype=np.float32)))
+        filas = np.asarray(filas, dtype=np.intp)
+        if len(filas) == 0:
+            return np.empty(0, dtype=np.float32)
+        if self.modo == "float32":
+            return self._vectores[filas] @ consulta[0]
+        return self._repuntuar(consulta, filas[None, :])[0]
+
+    def buscar(self, consultas, k=5):
+        """Devuelve (índices, similitudes) de las k filas más parecidas.
+
+        `consultas` puede ser un vector (resultado 1-D) o una matriz con una
+        pregunta por fila (resultado 2-D, una fila por pregunta).
+        """
+        consultas = np.asarray(consultas, dtype=np.float32)
+        un_vector = consultas.ndim == 1
+        consultas = normalizar_filas(np.atleast_2d(consultas))
+
+        if len(self._vectores) == 0:
+            indices, similitudes = top_k(np.empty((len(consultas), 0), dtype=np.float32), k)
+        elif self.modo == "float32":
+            indices, similitudes = top_k(self._puntuar(consultas), k)
+        else:
+            candidatos, _ = top_k(self._puntuar(consultas), k * self.factor_candidatos)
+            exactas = self._repuntuar(consultas, candidatos)
+            posiciones, similitudes = top_k(exactas, k)
+            indices = np.take_along_axis(candidatos, posiciones, axis=1)
+
+        if un_vector:
+            return indices[0], similitudes[0]
+        return indices, similitudes
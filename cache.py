@@ -0,0 +1,257 @@
+# ==============================================
+# 🧠 Cachés persistentes compartidas entre sesiones y procesos
+# ==============================================
+
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+RUTA_CACHE = "cache_consultas.sqlite"
+
+# Embeddings de preguntas: hasta 50.000 entradas, válidas 30 días
+MAX_EMBEDDINGS = 50_000
+TTL_EMBEDDINGS = 30 * 24 * 3600
+
+
+def _clave(*partes):
+    return hashlib.sha256("\x1f".join(partes).encode("utf-8")).hexdigest()
+
+
+def _conectar(ruta):
+    # WAL permite que varios procesos de Streamlit lean y escriban a la vez
+    conexion = sqlite3.connect(ruta, timeout=30, check_same_thread=False)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    return conexion
+
+
+class CacheEmbeddings:
+    """Caché LRU/TTL de embeddings de preguntas, persistida en SQLite.
+
+    La clave es (modelo, texto normalizado). Si varias sesiones piden a la
+    vez el mismo texto, solo la primera llama a la API y el resto espera su
+    resultado. Lleva contadores de aciertos, fallos y latencias.
+    """
+
+    def __init__(self, ruta=RUTA_CACHE, max_entradas=MAX_EMBEDDINGS, ttl=TTL_EMBEDDINGS):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._conexion = _conectar(ruta)
+        self._conexion.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings_consultas (
+                   clave TEXT PRIMARY KEY,
+                   vector BLOB NOT NULL,
+                   creado REAL NOT NULL,
+                   usado REAL NOT NULL
+               )"""
+        )
+        self._conexion.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_consultas_usado ON embeddings_consultas (usado)"
+        )
+        self._conexion.commit()
+        self._lock = threading.Lock()
+        self._en_vuelo = {}
+        self._contadores = {"aciertos": 0, "fallos": 0, "esperas": 0, "segundos_api": 0.0, "segundos_cache": 0.0}
+
+    def _leer(self, clave):
+        ahora = time.time()
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT vector, creado FROM embeddings_consultas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None:
+                return None
+            if ahora - fila[1] > self.ttl:
+                self._conexion.execute("DELETE FROM embeddings_consultas WHERE clave = ?", (clave,))
+                self._conexion.commit()
+                return None
+            self._conexion.execute("UPDATE embeddings_consultas SET usado = ? WHERE clave = ?", (ahora, clave))
+            self._conexion.commit()
+        return np.frombuffer(fila[0], dtype=np.float32)
+
+    def _escribir(self, clave, vector):
+        ahora = time.time()
+        with self._lock:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO embeddings_consultas (clave, vector, creado, usado) VALUES (?, ?, ?, ?)",
+                (clave, np.asarray(vector, dtype=np.float32).tobytes(), ahora, ahora),
+            )
+            # Expulsa las entradas caducadas y, si aún sobra, las menos usadas
+            self._conexion.execute("DELETE FROM embeddings_consultas WHERE creado < ?", (ahora - self.ttl,))
+            self._conexion.execute(
+                """DELETE FROM embeddings_consultas WHERE clave IN (
+                       SELECT clave FROM embeddings_consultas ORDER BY usado DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entradas,),
+            )
+            self._conexion.commit()
+
+    def obtener(self, texto, calcular, modelo):
+        """Embedding de `texto`; si no está en caché lo obtiene con `calcular(texto)`."""
+        inicio = time.perf_counter()
+        clave = _clave(modelo, texto)
+        vector = self._leer(clave)
+        if vector is not None:
+            with self._lock:
+                self._contadores["aciertos"] += 1
+                self._contadores["segundos_cache"] += time.perf_counter() - inicio
+            return vector
+
+        with self._lock:
+            futuro = self._en_vuelo.get(clave)
+            propio = futuro is None
+            if propio:
+                futuro = self._en_vuelo[clave] = Future()
+            else:
+                self._contadores["esperas"] += 1
+
+        if not propio:
+            return futuro.result()
+
+        try:
+            # Otra petición pudo terminar entre la lectura y el registro en vuelo
+            vector = self._leer(clave)
+            if vector is not None:
+                futuro.set_result(vector)
+                return vector
+            inicio_api = time.perf_counter()
+            vector = np.asarray(calcular(texto), dtype=np.float32)
+            segundos_api = time.perf_counter() - inicio_api
+            self._escribir(clave, vector)
+            futuro.set_result(vector)
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._en_vuelo.pop(clave, None)
+
+        with self._lock:
+            self._contadores["fallos"] += 1
+            self._contadores["segundos_api"] += segundos_api
+        return vector
+
+    def estadisticas(self):
+        """Contadores y latencias medias (ms) de la caché en este proceso."""
+        with self._lock:
+            c = dict(self._contadores)
+        c["latencia_api_ms"] = 1000 * c["segundos_api"] / c["fallos"] if c["fallos"] else 0.0
+        c["latencia_cache_ms"] = 1000 * c["segundos_cache"] / c["aciertos"] if c["aciertos"] else 0.0
+        return c
+
+
+# Respuestas generadas: hasta 5.000 entradas, válidas 7 días
+MAX_RESPUESTAS = 5_000
+TTL_RESPUESTAS = 7 * 24 * 3600
+# Similitud coseno mínima entre preguntas para reutilizar una respuesta
+UMBRAL_RESPUESTAS = 0.95
+
+
+def hash_contexto(texto):
+    """Huella del contexto recuperado (fragmentos + plantilla) que acompaña a la pregunta."""
+    return _clave(texto)
+
+
+class CacheRespuestas:
+    """Caché semántica de respuestas generadas por el modelo, persistida en SQLite.
+
+    Una respuesta se reutiliza si el contexto recuperado es idéntico (mismo
+    hash), la versión de la base de conocimiento coincide y la pregunta es
+    igual en forma canónica o su embedding supera `umbral` de similitud con
+    el de la pregunta original. Al cambiar la versión se descartan las
+    entradas antiguas.
+    """
+
+    def __init__(self, ruta=RUTA_CACHE, umbral=UMBRAL_RESPUESTAS, max_entradas=MAX_RESPUESTAS, ttl=TTL_RESPUESTAS):
+        self.ruta = ruta
+        self.umbral = umbral
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._conexion = _conectar(ruta)
+        self._conexion.execute(
+            """CREATE TABLE IF NOT EXISTS respuestas (
+                   id INTEGER PRIMARY KEY,
+                   version TEXT NOT NULL,
+                   contexto TEXT NOT NULL,
+                   pregunta TEXT NOT NULL,
+                   vector BLOB,
+                   respuesta TEXT NOT NULL,
+                   creado REAL NOT NULL,
+                   usado REAL NOT NULL
+               )"""
+        )
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS respuestas_contexto ON respuestas (version, contexto)")
+        self._conexion.commit()
+        self._lock = threading.Lock()
+        self._version = None
+        self._contadores = {"aciertos": 0, "fallos": 0}
+
+    def _comprobar_version(self, version):
+        """Descarta las entradas de otras versiones de la base de conocimiento."""
+        if version != self._version:
+            self._conexion.execute("DELETE FROM respuestas WHERE version != ?", (version,))
+            self._conexion.commit()
+            self._version = version
+
+    def buscar(self, pregunta, vector, contexto, version):
+        """Respuesta guardada para una pregunta equivalente con el mismo contexto, o None.
+
+        `pregunta` va en forma canónica; `vector` puede ser None (entonces
+        solo cuenta la coincidencia exacta de la pregunta).
+        """
+        ahora = time.time()
+        with self._lock:
+            self._comprobar_version(version)
+            filas = self._conexion.execute(
+                "SELECT id, pregunta, vector, respuesta FROM respuestas "
+                "WHERE version = ? AND contexto = ? AND creado >= ?",
+                (version, contexto, ahora - self.ttl),
+            ).fetchall()
+
+            elegida = next((f for f in filas if f[1] == pregunta), None)
+            if elegida is None and vector is not None:
+                con_vector = [f for f in filas if f[2] is not None]
+                if con_vector:
+                    q = np.asarray(vector, dtype=np.float32)
+                    guardados = np.vstack([np.frombuffer(f[2], dtype=np.float32) for f in con_vector])
+                    similitudes = guardados @ q / (
+                        np.linalg.norm(guardados, axis=1) * np.linalg.norm(q) + 1e-12
+                    )
+                    mejor = int(similitudes.argmax())
+                    if similitudes[mejor] >= self.umbral:
+                        elegida = con_vector[mejor]
+
+            if elegida is None:
+                self._contadores["fallos"] += 1
+                return None
+            self._conexion.execute("UPDATE respuestas SET usado = ? WHERE id = ?", (ahora, elegida[0]))
+            self._conexion.commit()
+            self._contadores["aciertos"] += 1
+            return elegida[3]
+
+    def guardar(self, pregunta, vector, contexto, version, respuesta):
+        ahora = time.time()
+        blob = None if vector is None else np.asarray(vector, dtype=np.float32).tobytes()
+        with self._lock:
+            self._comprobar_version(version)
+            self._conexion.execute(
+                "INSERT INTO respuestas (version, contexto, pregunta, vector, respuesta, creado, usado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (version, contexto, pregunta, blob, respuesta, ahora, ahora),
+            )
+            # Expulsa las entradas caducadas y, si aún sobra, las menos usadas
+            self._conexion.execute("DELETE FROM respuestas WHERE creado < ?", (ahora - self.ttl,))
+            self._conexion.execute(
+                "DELETE FROM respuestas WHERE id IN ("
+                "SELECT id FROM respuestas ORDER BY usado DESC LIMIT -1 OFFSET ?)",
+                (self.max_entradas,),
+            )
+            self._conexion.commit()
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._contadores)
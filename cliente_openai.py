@@ -0,0 +1,169 @@
+# ==============================================
+# 🌐 Cliente OpenAI asíncrono compartido por el proceso
+# Bucle de eventos propio, pool HTTP, timeouts, reintentos y límite de concurrencia
+# ==============================================
+
+import asyncio
+import os
+import random
+import threading
+
+from openai import AsyncOpenAI
+
+from almacen_embeddings import ERRORES_REINTENTABLES, REINTENTOS
+
+MODELO_CHAT = "gpt-4o-mini"
+# Peticiones a la API en curso a la vez en todo el proceso (todas las sesiones)
+CONCURRENCIA = int(os.getenv("OPENAI_CONCURRENCIA", "8"))
+# Segundos por intento
+TIMEOUT_EMBEDDING = 10.0
+TIMEOUT_CHAT = 60.0
+
+
+class ClienteOpenAI:
+    """AsyncOpenAI sobre un bucle de eventos en un hilo propio.
+
+    Todas las sesiones de Streamlit comparten el bucle, el pool de
+    conexiones HTTP y un semáforo que limita las peticiones en curso (las
+    esperas entre reintentos también ocupan su hueco, lo que frena al
+    proceso entero cuando la API devuelve 429). Un stream de chat libera su
+    hueco en cuanto se abre: leer una respuesta larga no retrasa los
+    embeddings de otras preguntas. El código síncrono usa
+    `ejecutar` e `iterar`; el asíncrono puede usar directamente `embedding`,
+    `completar` y `completar_stream` si corre en este mismo bucle.
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        base_url=None,
+        concurrencia=CONCURRENCIA,
+        reintentos=REINTENTOS,
+        timeout_embedding=TIMEOUT_EMBEDDING,
+        timeout_chat=TIMEOUT_CHAT,
+    ):
+        self.reintentos = reintentos
+        self.timeout_embedding = timeout_embedding
+        self.timeout_chat = timeout_chat
+        self._bucle = asyncio.new_event_loop()
+        self._hilo = threading.Thread(target=self._bucle.run_forever, name="cliente-openai", daemon=True)
+        self._hilo.start()
+        self.ejecutar(self._iniciar(api_key, base_url or os.getenv("OPENAI_BASE_URL"), concurrencia))
+
+    async def _iniciar(self, api_key, base_url, concurrencia):
+        # El pool HTTP de AsyncOpenAI y el semáforo quedan ligados a este bucle;
+        # los reintentos los gestiona _con_reintentos
+        self._api = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self._semaforo = asyncio.Semaphore(concurrencia)
+
+    # ------------------------------------------------------------------
+    # Puente con el código síncrono
+    # ------------------------------------------------------------------
+    def ejecutar(self, corrutina, timeout=None):
+        """Ejecuta `corrutina` en el bucle del cliente y espera su resultado.
+
+        No debe llamarse desde el propio bucle (se bloquearía); desde una
+        corrutina, usar `await` o `asyncio.to_thread`.
+        """
+        futuro = asyncio.run_coroutine_threadsafe(corrutina, self._bucle)
+        try:
+            return futuro.result(timeout)
+        except BaseException:
+            # Ctrl+C, timeout o Streamlit deteniendo la sesión: no dejar la tarea huérfana
+            futuro.cancel()
+            raise
+
+    def iterar(self, generador):
+        """Recorre un generador asíncrono desde código síncrono."""
+        try:
+            while True:
+                try:
+                    yield self.ejecutar(generador.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.ejecutar(generador.aclose())
+
+    def cerrar(self):
+        """Cierra el pool HTTP y detiene el bucle."""
+        if self._api is not None:
+            self.ejecutar(self._api.close())
+        self._bucle.call_soon_threadsafe(self._bucle.stop)
+        self._hilo.join()
+
+    # ------------------------------------------------------------------
+    # Llamadas a la API (corrutinas del bucle del cliente)
+    # ------------------------------------------------------------------
+    async def _con_reintentos(self, llamada):
+        """Espera `llamada()` con reintentos y backoff exponencial con jitter."""
+        for intento in range(self.reintentos + 1):
+            try:
+                return await llamada()
+            except ERRORES_REINTENTABLES as e:
+                if intento == self.reintentos:
+                    raise
+                espera = min(60, 2 ** intento) * (0.5 + random.random())
+                print(f"⏳ {type(e).__name__} — reintento {intento + 1}/{self.reintentos} en {espera:.1f}s")
+                await asyncio.sleep(espera)
+
+    async def embedding(self, texto, modelo, limite=None):
+        """Embedding de `texto`. `limite` acota en segundos la llamada con sus
+        reintentos, sin contar la espera por un hueco del semáforo
+        (asyncio.TimeoutError si se supera)."""
+        async with self._semaforo:
+            respuesta = await asyncio.wait_for(
+                self._con_reintentos(
+                    lambda: self._api.embeddings.create(model=modelo, input=texto, timeout=self.timeout_embedding)
+                ),
+                limite,
+            )
+        return respuesta.data[0].embedding
+
+    async def embeddings(self, textos, modelo):
+        """Embeddings de una lista de textos en una sola petición, en el mismo orden."""
+        async with self._semaforo:
+            respuesta = await self._con_reintentos(
+                lambda: self._api.embeddings.create(model=modelo, input=list(textos), timeout=self.timeout_chat)
+            )
+        return [d.embedding for d in sorted(respuesta.data, key=lambda d: d.index)]
+
+    async def completar(self, prompt, temperatura, modelo=MODELO_CHAT):
+        async with self._semaforo:
+            respuesta = await self._con_reintentos(
+                lambda: self._api.chat.completions.create(
+                    model=modelo,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperatura,
+                    timeout=self.timeout_chat,
+                )
+            )
+        return respuesta.choices[0].message.content.strip()
+
+    async def completar_stream(self, prompt, temperatura, modelo=MODELO_CHAT, uso=None):
+        """Tokens de la respuesta según llegan.
+
+        Solo se reintenta la apertura del stream: una vez llegan tokens, un
+        corte se propaga. El timeout se aplica a cada lectura, no al total.
+        El hueco del semáforo solo se ocupa mientras se abre el stream.
+        Si se pasa el diccionario `uso`, al terminar se rellena con los tokens
+        de entrada y salida que informa la API.
+        """
+        opciones = {"stream_options": {"include_usage": True}} if uso is not None else {}
+        async with self._semaforo:
+            flujo = await self._con_reintentos(
+                lambda: self._api.chat.completions.create(
+                    model=modelo,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperatura,
+                    stream=True,
+                    timeout=self.timeout_chat,
+                    **opciones,
+                )
+            )
+        async with flujo:
+            async for evento in flujo:
+                if uso is not None and getattr(evento, "usage", None):
+                    uso.update(entrada=evento.usage.prompt_tokens, salida=evento.usage.completion_tokens)
+                token = evento.choices[0].delta.content if evento.choices else None
+                if token:
+                    yield token
@@ -0,0 +1,139 @@
+# ==============================================
+# ✅ Comprobación de extremo a extremo contra el servidor local (sin OpenAI)
+# Uso: python comprobar_stub.py  (termina con código 1 si algo falla)
+# Cubre el cliente asíncrono real: reintentos ante 429, streaming, formato final
+# y que las respuestas en curso no dejen sin embeddings a otras preguntas
+# ==============================================
+
+import asyncio
+import contextlib
+import io
+import sys
+import tempfile
+import time
+
+import servidor_stub
+from benchmarks.pipeline import construir_kb
+from cliente_openai import ClienteOpenAI
+from nucleo import DESPEDIDA, Chatbot, saludo_para
+
+DIMENSION = 256
+FILAS = 200
+# Fracción de peticiones que el servidor rechaza con 429; con la semilla fija
+# los rechazos son siempre los mismos
+FALLOS = 0.3
+SEMILLA = 9
+HORA = 9
+# Sin coincidencia exacta ni tema enrutado: cada una pide un embedding y un chat
+PREGUNTAS = [
+    "¿Qué requisitos de etiquetado tiene la sustancia Nº 17 en niños?",
+    "¿Hace falta notificar un champú con la sustancia Nº 42?",
+    "¿Qué advertencias de seguridad lleva un producto con la sustancia Nº 99?",
+]
+RUTAS = {"embeddings": "/v1/embeddings", "chat": "/v1/chat/completions"}
+# Escenario de carga: tantas respuestas en streaming como huecos tiene el cliente
+CONCURRENCIA = 2
+LATENCIA_TOKEN = 0.1
+LIMITE_EMBEDDING = 1.0
+
+
+def comprobar(fallos=FALLOS, semilla=SEMILLA):
+    """Lista de comprobaciones fallidas (vacía si todo va bien)."""
+    with tempfile.TemporaryDirectory() as directorio:
+        with contextlib.redirect_stdout(io.StringIO()):
+            kb = construir_kb(directorio, FILAS, DIMENSION)
+        errores = comprobar_respuestas(kb, fallos, semilla) + comprobar_concurrencia(kb)
+        del kb  # libera el mmap antes de borrar el directorio
+    return errores
+
+
+def comprobar_respuestas(kb, fallos=FALLOS, semilla=SEMILLA):
+    """Reintentos, streaming, formato y peticiones por pregunta."""
+    errores = []
+    servidor = servidor_stub.arrancar(fallos=fallos, dimension=DIMENSION, semilla=semilla)
+    cliente = ClienteOpenAI(api_key="stub", base_url=servidor.url)
+    try:
+        # Límite holgado: las esperas entre reintentos no deben pasar a la búsqueda léxica
+        bot = Chatbot(kb, cliente, limite_embedding=120)
+        for pregunta in PREGUNTAS:
+            preparada = cliente.ejecutar(bot.preparar_respuesta(pregunta, hora=HORA))
+            trozos = list(cliente.iterar(preparada.trozos))
+            respuesta = "".join(trozos)
+            if len(trozos) < 3:
+                errores.append(f"{pregunta}: la respuesta llegó en {len(trozos)} trozo(s), sin streaming")
+            if not respuesta.startswith(saludo_para(HORA)):
+                errores.append(f"{pregunta}: no empieza por el saludo")
+            if not respuesta.endswith(DESPEDIDA):
+                errores.append(f"{pregunta}: no termina con la despedida")
+            if respuesta.count("Departamento Técnico") != 1:
+                errores.append(f"{pregunta}: la firma del modelo no se ha recortado")
+    finally:
+        cliente.cerrar()
+        servidor.shutdown()
+
+    for tipo, ruta in RUTAS.items():
+        if fallos and not servidor.rechazadas.get(ruta):
+            errores.append(f"{tipo}: ninguna petición rechazada, no se han probado sus reintentos")
+        aceptadas = servidor.contadores.get(ruta, 0) - servidor.rechazadas.get(ruta, 0)
+        if aceptadas != len(PREGUNTAS):
+            errores.append(f"{tipo}: {aceptadas} peticiones atendidas, se esperaban {len(PREGUNTAS)}")
+    print(f"📊 Peticiones: {servidor.contadores} — rechazadas con 429: {servidor.rechazadas}")
+    return errores
+
+
+async def _buscar_durante_respuestas(bot, en_curso, pregunta):
+    """(respuestas llegando al empezar, origen del contexto de `pregunta`, segundos
+    que tardó) con las respuestas de `en_curso` en streaming."""
+
+    async def consumir(otra):
+        preparada = await bot.preparar_respuesta(otra, hora=HORA)
+        async for _ in preparada.trozos:
+            pass
+
+    tareas = [asyncio.create_task(consumir(otra)) for otra in en_curso]
+    await asyncio.sleep(4 * LATENCIA_TOKEN)  # los streams ya están abiertos
+    try:
+        llegando = sum(not tarea.done() for tarea in tareas)
+        inicio = time.perf_counter()
+        contexto = await bot.buscar_contexto(pregunta)
+        return llegando, contexto.origen, time.perf_counter() - inicio
+    finally:
+        await asyncio.gather(*tareas)
+
+
+def comprobar_concurrencia(kb):
+    """Con todos los huecos del cliente ocupados por respuestas en streaming, el
+    embedding de otra pregunta no debe agotar `limite_embedding`."""
+    errores = []
+    servidor = servidor_stub.arrancar(latencia_token=LATENCIA_TOKEN, dimension=DIMENSION)
+    cliente = ClienteOpenAI(api_key="stub", base_url=servidor.url, concurrencia=CONCURRENCIA)
+    try:
+        bot = Chatbot(kb, cliente, limite_embedding=LIMITE_EMBEDDING)
+        with contextlib.redirect_stdout(io.StringIO()):
+            llegando, origen, segundos = cliente.ejecutar(
+                _buscar_durante_respuestas(bot, PREGUNTAS[:CONCURRENCIA], PREGUNTAS[CONCURRENCIA])
+            )
+    finally:
+        cliente.cerrar()
+        servidor.shutdown()
+
+    if llegando < CONCURRENCIA:
+        errores.append(f"solo {llegando} de {CONCURRENCIA} respuestas en streaming: el escenario no es válido")
+    if origen == "lexica":
+        errores.append("con respuestas en streaming, el embedding esperó hueco y se respondió solo con BM25")
+    elif segundos >= LIMITE_EMBEDDING:
+        errores.append(f"con respuestas en streaming, el contexto tardó {segundos:.1f}s en recuperarse")
+    return errores
+
+
+def main():
+    errores = comprobar()
+    for error in errores:
+        print(f"❌ {error}")
+    if errores:
+        sys.exit(1)
+    print("✅ Streaming, reintentos, formato y concurrencia correctos contra el servidor local.")
+
+
+if __name__ == "__main__":
+    main()
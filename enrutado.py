@@ -0,0 +1,134 @@
+# ==============================================
+# 🧭 Enrutado de preguntas por tema
+# Tabla declarativa compilada en una única expresión regular
+# ==============================================
+
+import re
+import threading
+from collections import Counter
+from typing import NamedTuple
+
+
+class Ruta(NamedTuple):
+    """Regla de enrutado: si la pregunta contiene alguno de sus términos, se
+    responde con `manejador` en lugar de buscar en el histórico.
+
+    - palabras: términos completos (con límites de palabra)
+    - subcadenas: términos que pueden aparecer dentro de otra palabra
+    - patrones: expresiones regulares
+    - excluir: términos que, si aparecen (aunque sea dentro de otra palabra), anulan la regla
+    """
+    tema: str
+    manejador: str
+    prioridad: int
+    palabras: tuple = ()
+    subcadenas: tuple = ()
+    patrones: tuple = ()
+    excluir: tuple = ()
+
+
+# Los términos se comparan contra la pregunta en la forma de normalizar_enrutado:
+# sin acentos, en minúsculas y sin puntuación.
+RUTAS = (
+    Ruta(
+        "internacional", "redireccion", 1,
+        palabras=(
+            "exportar", "exportacion", "terceros paises", "fuera de la ue",
+            "suiza", "australia", "nueva zelanda", "eeuu", "ee uu", "china",
+            "reino unido", "panama", "canada", "japon", "corea",
+            "india", "brasil", "mexico",
+        ),
+    ),
+    Ruta(
+        "sostenibilidad", "redireccion", 2,
+        palabras=(
+            "sostenibilidad", "envase sostenible", "reciclaje", "reciclado",
+            "simbolos de contenedores", "contenedor", "etiqueta ambiental",
+            "huella de carbono", "ecodiseno", "packaging sostenible", "material reciclado",
+        ),
+    ),
+    Ruta(
+        "vitamina a", "frases", 3,
+        subcadenas=("vitamina a", "retinol", "retinil"),
+    ),
+    Ruta(
+        "cosmetica para animales", "frases", 4,
+        subcadenas=(
+            "cosmetica animal", "cosmetica para animales", "higiene animal",
+            "cuidado animal", "cosmetica veterinaria", "productos para mascotas",
+        ),
+    ),
+    Ruta(
+        "e metrologica", "e_metrologica", 5,
+        patrones=(r"℮", r"\be ?metrologic"),
+        excluir=("vitamina",),
+    ),
+)
+
+
+def _alternativa(ruta):
+    partes = []
+    # Los términos más largos primero para que la alternancia no se quede con un prefijo
+    if ruta.palabras:
+        palabras = sorted(ruta.palabras, key=len, reverse=True)
+        partes.append(r"\b(?:" + "|".join(re.escape(p) for p in palabras) + r")\b")
+    if ruta.subcadenas:
+        subcadenas = sorted(ruta.subcadenas, key=len, reverse=True)
+        partes.append("|".join(re.escape(s) for s in subcadenas))
+    partes.extend(ruta.patrones)
+    return "|".join(f"(?:{p})" for p in partes)
+
+
+class MotorEnrutado:
+    """Detecta todos los temas de una pregunta en una sola pasada.
+
+    Todas las reglas se compilan una vez en una alternancia con un grupo con
+    nombre por regla, envuelta en una lookahead para que coincidencias de
+    reglas distintas puedan solaparse. Si dos reglas empiezan en la misma
+    posición, cuenta la de mayor prioridad. Lleva un contador de aciertos
+    por regla.
+    """
+
+    def __init__(self, rutas=RUTAS):
+        self.rutas = tuple(sorted(rutas, key=lambda r: r.prioridad))
+        alternativas = [f"(?P<r{i}>{_alternativa(r)})" for i, r in enumerate(self.rutas)]
+        # Los términos de exclusión van detrás: solo cuentan donde no empieza una regla
+        self._exclusiones = sorted({t for r in self.rutas for t in r.excluir})
+        alternativas += [
+            f"(?P<x{i}>{re.escape(t)})" for i, t in enumerate(self._exclusiones)
+        ]
+        self._patron = re.compile("(?=" + "|".join(alternativas) + ")")
+        self._aciertos = Counter()
+        self._lock = threading.Lock()
+
+    def detectar(self, texto, contar=True):
+        """Reglas que aplican a `texto` (ya normalizado), ordenadas por prioridad."""
+        rutas, excluidos = set(), set()
+        for coincidencia in self._patron.finditer(texto):
+            grupo = coincidencia.lastgroup
+            if grupo[0] == "r":
+                rutas.add(int(grupo[1:]))
+            else:
+                excluidos.add(self._exclusiones[int(grupo[1:])])
+        aplicables = [
+            self.rutas[i] for i in sorted(rutas)
+            if not excluidos.intersection(self.rutas[i].excluir)
+        ]
+        if aplicables and contar:
+            with self._lock:
+                self._aciertos.update(r.tema for r in aplicables)
+        return aplicables
+
+    def enrutar(self, texto):
+        """Regla de mayor prioridad que aplica a `texto`, o None."""
+        aplicables = self.detectar(texto)
+        return aplicables[0] if aplicables else None
+
+    def aciertos(self):
+        """Copia de los contadores de aciertos por tema."""
+        with self._lock:
+            return dict(self._aciertos)
+
+
+# Instancia compartida por el proceso: el patrón se compila una sola vez
+MOTOR = MotorEnrutado()
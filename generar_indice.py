@@ -0,0 +1,167 @@
+# ==============================================
+# 🏗️ Generación offline del índice de embeddings
+# Uso: python generar_indice.py [--salida indice] [--float16]
+# Solo se piden a la API los textos nuevos o modificados; el índice léxico
+# (BM25) se reconstruye entero, sin llamadas a la API
+# El índice (indice/) y el almacén de vectores no se versionan: cada
+# despliegue los genera con este script antes de arrancar la app
+# ==============================================
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from openai import OpenAI
+
+from almacen_embeddings import (
+    CONCURRENCIA,
+    RUTA_ALMACEN,
+    TAM_LOTE,
+    AlmacenEmbeddings,
+    embeber_incremental,
+)
+from base_conocimiento import CARPETA_PDFS, RUTA_EXCEL, leer_pares
+from busqueda import normalizar_filas
+from indice import (
+    DIRECTORIO_INDICE,
+    FUENTE_EXCEL,
+    MODELO_EMBEDDINGS,
+    escribir_indice,
+    hashes_fuentes,
+    listar_pdfs,
+)
+from lexico import IndiceLexico, stop_words_espanol
+from normalizacion import normalizar_embedding
+from pdfs import MAX_TOKENS_FRAGMENTO, SOLAPE_TOKENS, trocear_pdf
+
+
+def generar_indice(
+    ruta_excel=RUTA_EXCEL,
+    carpeta_pdfs=CARPETA_PDFS,
+    salida=DIRECTORIO_INDICE,
+    modelo=MODELO_EMBEDDINGS,
+    float16=False,
+    max_tokens=MAX_TOKENS_FRAGMENTO,
+    solape=SOLAPE_TOKENS,
+    ruta_almacen=RUTA_ALMACEN,
+    tam_lote=TAM_LOTE,
+    concurrencia=CONCURRENCIA,
+    client=None,
+):
+    """Construye el índice: primero las consultas del Excel y después los
+    fragmentos de los PDFs (con página y sección de cada uno).
+
+    Los vectores se reutilizan desde el almacén por hash del texto normalizado,
+    así que solo se embeben las filas y fragmentos nuevos o modificados. El
+    índice léxico cubre pregunta + respuesta de cada fila y sección + texto
+    de cada fragmento.
+    """
+    # Los reintentos los gestiona crear_embeddings, no el SDK
+    client = client or OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    inicio = time.perf_counter()
+
+    consultas, respuestas = leer_pares(ruta_excel)
+    # Se embebe el mismo texto normalizado que se usa al consultar
+    textos = [normalizar_embedding(c) for c in consultas]
+    textos_lexicos = [f"{c}\n{r}" for c, r in zip(consultas, respuestas)]
+    metadatos = [
+        {"fuente": FUENTE_EXCEL, "fila": i, "pagina": 0, "pagina_fin": 0, "seccion": ""}
+        for i in range(len(consultas))
+    ]
+    print(f"📊 {len(consultas)} consultas leídas de {ruta_excel}")
+
+    rutas_pdf = listar_pdfs(carpeta_pdfs)
+    textos_embebidos = list(textos)
+    n_fragmentos = 0
+    for ruta in rutas_pdf:
+        nombre = os.path.basename(ruta)
+        try:
+            for i, fragmento in enumerate(trocear_pdf(ruta, max_tokens=max_tokens, solape=solape)):
+                textos.append(fragmento.texto)
+                # La sección se embebe junto al texto para dar contexto al fragmento
+                textos_embebidos.append(
+                    normalizar_embedding(f"{fragmento.seccion}\n{fragmento.texto}")
+                )
+                textos_lexicos.append(f"{fragmento.seccion}\n{fragmento.texto}")
+                metadatos.append({
+                    "fuente": nombre,
+                    "fila": i,
+                    "pagina": fragmento.pagina_inicio,
+                    "pagina_fin": fragmento.pagina_fin,
+                    "seccion": fragmento.seccion,
+                })
+                n_fragmentos += 1
+        except Exception as e:
+            print(f"⚠️ Error leyendo {ruta}: {e}")
+    print(f"📄 {n_fragmentos} fragmentos de {len(rutas_pdf)} PDFs leídos de {carpeta_pdfs}")
+
+    almacen = AlmacenEmbeddings(ruta_almacen)
+    try:
+        embeddings, estadisticas = embeber_incremental(
+            client, textos_embebidos, modelo, almacen,
+            tam_lote=tam_lote, concurrencia=concurrencia,
+        )
+    finally:
+        almacen.cerrar()
+    print(f"♻️ {estadisticas['reutilizados']} vectores reutilizados, "
+          f"🆕 {estadisticas['recalculados']} recalculados")
+    # Filas de norma 1: la búsqueda float32 usa la matriz mapeada sin copiarla
+    embeddings = normalizar_filas(embeddings)
+    if float16:
+        embeddings = embeddings.astype(np.float16)
+
+    inicio_lexico = time.perf_counter()
+    lexico = IndiceLexico.construir(textos_lexicos, stop_words_espanol())
+    print(f"🔤 Índice léxico: {len(lexico.vocabulario)} términos en {time.perf_counter() - inicio_lexico:.1f}s")
+
+    manifiesto = escribir_indice(
+        salida,
+        embeddings,
+        pd.DataFrame(metadatos),
+        textos,
+        {
+            "modelo": modelo,
+            "fuentes": hashes_fuentes(ruta_excel, rutas_pdf),
+            "filas_por_tipo": {FUENTE_EXCEL: len(consultas), "pdf": n_fragmentos},
+            "fragmentos": {"max_tokens": max_tokens, "solape": solape},
+            "normalizados": True,
+        },
+        lexico=lexico,
+    )
+    print(f"✅ Índice escrito en '{salida}' ({manifiesto['filas']} filas, "
+          f"{manifiesto['dtype']}) en {time.perf_counter() - inicio:.1f}s")
+    return manifiesto
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera el índice de embeddings (Excel + PDFs).")
+    parser.add_argument("--excel", default=RUTA_EXCEL, help="Excel con las conversaciones revisadas")
+    parser.add_argument("--pdfs", default=CARPETA_PDFS, help="Carpeta con los PDFs normativos")
+    parser.add_argument("--salida", default=DIRECTORIO_INDICE, help="Directorio del índice")
+    parser.add_argument("--modelo", default=MODELO_EMBEDDINGS, help="Modelo de embeddings de OpenAI")
+    parser.add_argument("--float16", action="store_true", help="Guardar la matriz en float16 (la mitad de tamaño)")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS_FRAGMENTO, help="Tamaño máximo de cada fragmento de PDF")
+    parser.add_argument("--solape", type=int, default=SOLAPE_TOKENS, help="Tokens repetidos entre fragmentos consecutivos")
+    parser.add_argument("--almacen", default=RUTA_ALMACEN, help="SQLite con los vectores ya calculados")
+    parser.add_argument("--tam-lote", type=int, default=TAM_LOTE, help="Textos por petición a la API")
+    parser.add_argument("--concurrencia", type=int, default=CONCURRENCIA, help="Peticiones simultáneas a la API")
+    args = parser.parse_args(argv)
+
+    generar_indice(
+        ruta_excel=args.excel,
+        carpeta_pdfs=args.pdfs,
+        salida=args.salida,
+        modelo=args.modelo,
+        float16=args.float16,
+        max_tokens=args.max_tokens,
+        solape=args.solape,
+        ruta_almacen=args.almacen,
+        tam_lote=args.tam_lote,
+        concurrencia=args.concurrencia,
+    )
+
+
+if __name__ == "__main__":
+    main()
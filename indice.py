@@ -0,0 +1,181 @@
+# ==============================================
+# 🗂️ Índice de embeddings versionado
+# embeddings.npy + metadatos.csv + textos.txt + manifest.json (+ lexico.npz)
+# ==============================================
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from lexico import IndiceLexico
+
+DIRECTORIO_INDICE = "indice"
+VERSION_FORMATO = 2
+MODELO_EMBEDDINGS = "text-embedding-3-small"
+
+FICHERO_EMBEDDINGS = "embeddings.npy"
+FICHERO_METADATOS = "metadatos.csv"
+FICHERO_TEXTOS = "textos.txt"
+FICHERO_MANIFIESTO = "manifest.json"
+
+FUENTE_EXCEL = "excel"
+
+
+class IndiceIncompatibleError(ValueError):
+    """El índice no corresponde a las fuentes actuales (Excel/PDFs) o a este formato."""
+
+
+def listar_pdfs(carpeta="."):
+    """Rutas de los PDFs de la carpeta, en orden estable."""
+    return sorted(
+        os.path.join(carpeta, archivo)
+        for archivo in os.listdir(carpeta)
+        if archivo.lower().endswith(".pdf")
+    )
+
+
+def hash_fichero(ruta, tam_bloque=1 << 20):
+    """SHA-256 del contenido de un fichero."""
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(tam_bloque), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def hashes_fuentes(ruta_excel, rutas_pdf):
+    """Hash de cada fuente indexada, por nombre de fichero."""
+    fuentes = {os.path.basename(ruta_excel): hash_fichero(ruta_excel)}
+    for ruta in rutas_pdf:
+        fuentes[os.path.basename(ruta)] = hash_fichero(ruta)
+    return fuentes
+
+
+def escribir_indice(directorio, embeddings, metadatos, textos, manifiesto, lexico=None):
+    """Escribe el índice completo en un directorio temporal y lo sustituye al final.
+
+    `metadatos` es un DataFrame alineado fila a fila con `embeddings`; aquí se
+    le añaden las columnas `inicio`/`fin` (bytes) que localizan cada texto en
+    textos.txt. `lexico` (un IndiceLexico con un documento por fila) es opcional.
+    """
+    temporal = f"{directorio}.tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+
+    inicios, fines, posicion = [], [], 0
+    with open(os.path.join(temporal, FICHERO_TEXTOS), "wb") as f:
+        for texto in textos:
+            datos = texto.encode("utf-8")
+            f.write(datos)
+            inicios.append(posicion)
+            posicion += len(datos)
+            fines.append(posicion)
+
+    metadatos = metadatos.assign(inicio=inicios, fin=fines)
+    metadatos.to_csv(os.path.join(temporal, FICHERO_METADATOS), index=False)
+    np.save(os.path.join(temporal, FICHERO_EMBEDDINGS), embeddings)
+    if lexico is not None:
+        lexico.guardar(temporal)
+        manifiesto = {**manifiesto, "lexico": lexico.resumen()}
+
+    manifiesto = {
+        **manifiesto,
+        "version": VERSION_FORMATO,
+        "dimension": int(embeddings.shape[1]),
+        "dtype": str(embeddings.dtype),
+        "filas": int(embeddings.shape[0]),
+        "creado": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(temporal, FICHERO_MANIFIESTO), "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.replace(temporal, directorio)
+    return manifiesto
+
+
+class LectorTextos:
+    """Lee textos bajo demanda a partir de sus offsets, sin cargarlos todos."""
+
+    def __init__(self, ruta):
+        self._fichero = open(ruta, "rb")
+        if os.fstat(self._fichero.fileno()).st_size:
+            self._datos = mmap.mmap(self._fichero.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._datos = b""
+
+    def leer(self, inicio, fin):
+        return self._datos[inicio:fin].decode("utf-8")
+
+
+@dataclass(frozen=True)
+class Indice:
+    """Índice cargado: matriz mapeada en memoria + metadatos alineados."""
+    embeddings: np.ndarray
+    metadatos: pd.DataFrame
+    manifiesto: dict
+    textos: LectorTextos
+    lexico: object = None  # IndiceLexico, o None en índices generados sin él
+
+    def texto(self, fila):
+        """Texto indexado en la fila indicada (se lee del disco al pedirlo)."""
+        return self.textos.leer(
+            int(self.metadatos["inicio"].iat[fila]),
+            int(self.metadatos["fin"].iat[fila]),
+        )
+
+
+def leer_manifiesto(directorio=DIRECTORIO_INDICE):
+    with open(os.path.join(directorio, FICHERO_MANIFIESTO), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def cargar_indice(directorio, ruta_excel, rutas_pdf):
+    """Carga el índice con la matriz en modo mmap, validando el manifiesto.
+
+    Lanza FileNotFoundError si el índice no existe e IndiceIncompatibleError
+    si fue generado con otro formato o a partir de otras versiones del Excel
+    o de los PDFs (las filas dejarían de estar alineadas con los pares).
+    """
+    manifiesto = leer_manifiesto(directorio)
+
+    if manifiesto.get("version") != VERSION_FORMATO:
+        raise IndiceIncompatibleError(
+            f"Formato de índice {manifiesto.get('version')} no soportado (se espera {VERSION_FORMATO})."
+        )
+
+    esperados = manifiesto.get("fuentes", {})
+    actuales = hashes_fuentes(ruta_excel, rutas_pdf)
+    if esperados != actuales:
+        cambiados = sorted(
+            nombre for nombre in set(esperados) | set(actuales)
+            if esperados.get(nombre) != actuales.get(nombre)
+        )
+        raise IndiceIncompatibleError(
+            "El índice no coincide con las fuentes actuales (cambios en: "
+            + ", ".join(cambiados)
+            + "). Vuelve a ejecutar 'python generar_indice.py'."
+        )
+
+    embeddings = np.load(os.path.join(directorio, FICHERO_EMBEDDINGS), mmap_mode="r")
+    metadatos = pd.read_csv(os.path.join(directorio, FICHERO_METADATOS))
+    if len(metadatos) != embeddings.shape[0] or embeddings.shape[0] != manifiesto["filas"]:
+        raise IndiceIncompatibleError("Los metadatos del índice no están alineados con la matriz de embeddings.")
+    lexico = IndiceLexico.cargar(directorio)
+    if lexico is not None and len(lexico) != embeddings.shape[0]:
+        raise IndiceIncompatibleError("El índice léxico no está alineado con la matriz de embeddings.")
+
+    return Indice(
+        embeddings=embeddings,
+        metadatos=metadatos,
+        manifiesto=manifiesto,
+        textos=LectorTextos(os.path.join(directorio, FICHERO_TEXTOS)),
+        lexico=lexico,
+    )
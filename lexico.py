@@ -0,0 +1,201 @@
+# ==============================================
+# 🔤 Índice léxico BM25 (listas invertidas en arrays)
+# Se genera con el índice de embeddings y se guarda en lexico.npz
+# ==============================================
+
+import html
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+from nltk.stem.snowball import SnowballStemmer
+
+from busqueda import top_k
+from normalizacion import normalizar_texto, quitar_acentos
+
+FICHERO_LEXICO = "lexico.npz"
+# Parámetros de BM25: saturación de la frecuencia y peso de la longitud del documento
+K1 = 1.2
+B = 0.75
+# Fusión por rangos recíprocos (RRF): peso del ranking léxico frente al denso
+PESO_LEXICO = 1.0
+CONSTANTE_RRF = 60
+
+# Identificadores que la normalización partiría: "1223/2009", CAS "50-00-0", "10.1"
+RE_IDENTIFICADOR = re.compile(r"\b\d+(?:[/.\-]\d+)+\b")
+
+_raiz = lru_cache(maxsize=100_000)(SnowballStemmer("spanish").stem)
+
+
+def stop_words_espanol():
+    """Stopwords en español de NLTK (se descargan la primera vez)."""
+    import nltk
+    from nltk.corpus import stopwords
+
+    nltk.download("stopwords", quiet=True)
+    return frozenset(stopwords.words("spanish"))
+
+
+def terminos(texto, stop_words=frozenset()):
+    """Términos de un texto: raíces de las palabras sin acentos ni stopwords,
+    más los identificadores numéricos completos."""
+    texto = quitar_acentos(html.unescape(str(texto))).lower()
+    palabras = [
+        _raiz(p) for p in normalizar_texto(texto).split()
+        if p not in stop_words and (len(p) > 1 or p.isdigit())
+    ]
+    return palabras + RE_IDENTIFICADOR.findall(texto)
+
+
+def _a_bytes(cadenas):
+    return np.frombuffer("\n".join(cadenas).encode("utf-8"), dtype=np.uint8)
+
+
+def _de_bytes(array):
+    texto = array.tobytes().decode("utf-8")
+    return texto.split("\n") if texto else []
+
+
+class IndiceLexico:
+    """Índice invertido con puntuación BM25.
+
+    Las listas de cada término están en formato CSR: `inicio[t]:inicio[t+1]`
+    delimita sus documentos (int32) y frecuencias (uint16). Los pesos BM25 de
+    cada aparición se precalculan al cargar, así que puntuar una consulta es
+    sumar tramos de un array por cada término.
+    """
+
+    def __init__(self, vocabulario, inicio, documentos, frecuencias, longitudes, stop_words, k1=K1, b=B):
+        self.vocabulario = {termino: i for i, termino in enumerate(vocabulario)}
+        self.inicio = inicio
+        self.documentos = documentos
+        self.frecuencias = frecuencias
+        self.longitudes = longitudes
+        self.stop_words = frozenset(stop_words)
+        self.k1 = k1
+        self.b = b
+
+        n = len(longitudes)
+        apariciones = np.diff(inicio)
+        self.idf = np.log1p((n - apariciones + 0.5) / (apariciones + 0.5)).astype(np.float32)
+        media = float(longitudes.mean()) if n else 1.0
+        tf = frecuencias.astype(np.float32)
+        normalizacion = k1 * (1 - b + b * longitudes[documentos] / (media or 1.0))
+        self.pesos = (tf * (k1 + 1) / (tf + normalizacion)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.longitudes)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.inicio, self.documentos, self.frecuencias, self.longitudes, self.pesos))
+
+    @classmethod
+    def construir(cls, textos, stop_words=frozenset(), k1=K1, b=B):
+        """Índice de `textos`, un documento por texto y en el mismo orden."""
+        stop_words = frozenset(quitar_acentos(p).lower() for p in stop_words)
+        vocabulario, ids = [], {}
+        ids_terminos, ids_documentos, frecuencias, longitudes = [], [], [], []
+        for documento, texto in enumerate(textos):
+            cuenta = {}
+            for termino in terminos(texto, stop_words):
+                cuenta[termino] = cuenta.get(termino, 0) + 1
+            longitudes.append(sum(cuenta.values()))
+            for termino, n in cuenta.items():
+                if termino not in ids:
+                    ids[termino] = len(vocabulario)
+                    vocabulario.append(termino)
+                ids_terminos.append(ids[termino])
+                ids_documentos.append(documento)
+                frecuencias.append(min(n, np.iinfo(np.uint16).max))
+
+        ids_terminos = np.asarray(ids_terminos, dtype=np.int64)
+        orden = np.argsort(ids_terminos, kind="stable")  # dentro de cada término, por documento
+        inicio = np.zeros(len(vocabulario) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ids_terminos, minlength=len(vocabulario)), out=inicio[1:])
+        return cls(
+            vocabulario,
+            inicio,
+            np.asarray(ids_documentos, dtype=np.int32)[orden],
+            np.asarray(frecuencias, dtype=np.uint16)[orden],
+            np.asarray(longitudes, dtype=np.int32),
+            stop_words,
+            k1,
+            b,
+        )
+
+    def guardar(self, directorio):
+        vocabulario = sorted(self.vocabulario, key=self.vocabulario.get)
+        np.savez(
+            os.path.join(directorio, FICHERO_LEXICO),
+            vocabulario=_a_bytes(vocabulario),
+            inicio=self.inicio,
+            documentos=self.documentos,
+            frecuencias=self.frecuencias,
+            longitudes=self.longitudes,
+            stop_words=_a_bytes(sorted(self.stop_words)),
+            parametros=np.array([self.k1, self.b]),
+        )
+
+    @classmethod
+    def cargar(cls, directorio):
+        """Índice guardado en `directorio`, o None si el índice se generó sin él."""
+        ruta = os.path.join(directorio, FICHERO_LEXICO)
+        if not os.path.exists(ruta):
+            return None
+        with np.load(ruta) as datos:
+            k1, b = datos["parametros"].tolist()
+            return cls(
+                _de_bytes(datos["vocabulario"]),
+                datos["inicio"],
+                datos["documentos"],
+                datos["frecuencias"],
+                datos["longitudes"],
+                _de_bytes(datos["stop_words"]),
+                k1,
+                b,
+            )
+
+    def resumen(self):
+        """Datos del índice para el manifiesto."""
+        return {
+            "terminos": len(self.vocabulario),
+            "documentos": len(self),
+            "apariciones": int(len(self.documentos)),
+            "k1": self.k1,
+            "b": self.b,
+        }
+
+    def puntuar(self, texto):
+        """Puntuación BM25 de `texto` contra cada documento (0 si no comparten términos)."""
+        puntuaciones = np.zeros(len(self), dtype=np.float32)
+        for termino in set(terminos(texto, self.stop_words)):
+            t = self.vocabulario.get(termino)
+            if t is None:
+                continue
+            tramo = slice(self.inicio[t], self.inicio[t + 1])
+            # Cada documento aparece una sola vez por término: la suma indexada es segura
+            puntuaciones[self.documentos[tramo]] += self.idf[t] * self.pesos[tramo]
+        return puntuaciones
+
+    def buscar(self, puntuaciones, k, desde=0, hasta=None):
+        """Top-k (índices relativos a `desde`, puntuaciones) de un tramo, sin los que puntúan 0."""
+        indices, valores = top_k(puntuaciones[None, desde:hasta], k)
+        positivos = valores[0] > 0
+        return indices[0][positivos], valores[0][positivos]
+
+
+def fusionar(densos, lexicos, k, peso_lexico=PESO_LEXICO, constante=CONSTANTE_RRF):
+    """Las k filas mejor situadas en dos rankings, por fusión de rangos recíprocos.
+
+    Solo usa las posiciones: las similitudes coseno y las puntuaciones BM25
+    no están en la misma escala.
+    """
+    puntos = {}
+    for peso, ranking in ((1.0, densos), (peso_lexico, lexicos)):
+        for posicion, fila in enumerate(ranking):
+            fila = int(fila)
+            puntos[fila] = puntos.get(fila, 0.0) + peso / (constante + posicion + 1)
+    return sorted(puntos, key=lambda fila: -puntos[fila])[:k]
+
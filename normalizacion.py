@@ -0,0 +1,55 @@
+# ==============================================
+# 🔤 Normalización de texto
+# ==============================================
+
+import re
+import string
+import unicodedata
+
+# Signos entre letras/números que se eliminan sin separar ("EE.UU." -> "eeuu", "eco-diseño" -> "ecodiseno")
+_RE_SIGNO_INTERNO = re.compile(r"(?<=\w)[.\-'’´](?=\w)")
+# Cualquier otro signo (comillas, interrogaciones, barras...) separa palabras; "℮" se conserva
+_RE_SIGNO = re.compile(r"[^\w\s℮]")
+_RE_ESPACIOS = re.compile(r"\s+")
+_SIN_PUNTUACION = str.maketrans("", "", string.punctuation)
+
+
+def quitar_acentos(texto):
+    """Elimina acentos y caracteres diacríticos de un texto."""
+    return ''.join(
+        c for c in unicodedata.normalize('NFD', texto)
+        if unicodedata.category(c) != 'Mn'
+    )
+
+
+def normalizar_texto(texto):
+    """Forma canónica de una pregunta para compararla (búsqueda exacta, cachés).
+
+    Minúsculas, sin acentos, sin comillas ni puntuación y con los espacios
+    colapsados, de modo que variantes triviales de una misma pregunta dan
+    la misma clave.
+    """
+    texto = quitar_acentos(unicodedata.normalize("NFKC", str(texto))).lower()
+    texto = _RE_SIGNO_INTERNO.sub("", texto)
+    texto = _RE_SIGNO.sub(" ", texto)
+    return _RE_ESPACIOS.sub(" ", texto).strip()
+
+
+def normalizar_enrutado(texto):
+    """Forma con la que se enrutan las preguntas por palabras clave.
+
+    Es la de la versión original de la app (la puntuación ASCII se borra sin
+    separar palabras: "USA/Canadá" -> "usacanada"), para que ninguna
+    pregunta cambie de ruta; normalizar_texto la separaría y "canada"
+    activaría la redirección internacional.
+    """
+    return quitar_acentos(str(texto).lower()).translate(_SIN_PUNTUACION)
+
+
+def normalizar_embedding(texto):
+    """Texto que se envía al modelo de embeddings (consultas del Excel y preguntas).
+
+    Conserva la puntuación, que aporta significado al embedding; el índice
+    y el almacén de vectores se indexan por el hash de este texto.
+    """
+    return quitar_acentos(str(texto).strip().lower())
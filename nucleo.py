@@ -0,0 +1,750 @@
+# ==============================================
+# 🤖 Núcleo del chatbot: enrutado, recuperación y generación
+# Sin Streamlit: lo usan app.py y responder_lote.py
+# ==============================================
+
+import asyncio
+import os
+import re
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+from openai import OpenAIError
+
+from cache import hash_contexto
+from enrutado import MOTOR
+from lexico import fusionar
+from normalizacion import normalizar_embedding, normalizar_enrutado, normalizar_texto
+from trazas import TRAZA_NULA, activar, traza_actual
+
+# Recuperación: k vecinos y umbrales de similitud coseno
+TOP_K = 5
+UMBRAL_SIMILITUD = 0.78  # a partir de aquí se usa directamente la respuesta del Excel
+TOP_K_PDF = 3
+UMBRAL_PDF = 0.5
+# "densa" (solo embeddings), "hibrida" (embeddings y BM25 fusionados) o
+# "filtrada" (BM25 preselecciona candidatos y los embeddings los ordenan)
+MODOS_RECUPERACION = ("densa", "hibrida", "filtrada")
+RECUPERACION = os.getenv("RECUPERACION", "hibrida")
+# Candidatos léxicos que se puntúan con embeddings en modo "filtrada"
+CANDIDATOS_FILTRO = 100
+# Segundos que se espera al embedding antes de responder solo con la búsqueda léxica
+LIMITE_EMBEDDING = float(os.getenv("LIMITE_EMBEDDING", "5"))
+
+# Conversación previa que acompaña a cada pregunta: últimos turnos, con tope de tokens
+MAX_TURNOS_HISTORIAL = 3
+PRESUPUESTO_HISTORIAL = 600  # tokens aproximados
+CARACTERES_POR_TOKEN = 4
+# Una pregunta se toma como continuación de la anterior si es corta y la
+# menciona o la enlaza ("¿y en niños?", "¿eso aplica también a...?"); la
+# longitud sola no basta: "Etiquetado de cosméticos" es una búsqueda completa
+MAX_PALABRAS_SEGUIMIENTO = 12
+RE_SEGUIMIENTO = re.compile(
+    r"^(?:y|e|pero|entonces|tambien|ademas|en ese caso|en tal caso)\b"
+    r"|\b(?:eso|esto|ese|esa|esos|esas|dicho|dicha|dichos|dichas|ello|lo anterior|lo mismo|d?el mismo|la misma)\b"
+)
+
+# ==============================================
+# FRASES POR TEMA
+# ==============================================
+FRASES_POR_TEMA = {
+    "cosmetico": [
+        "“Un producto cosmético, según el Reglamento (CE) nº 1223/2009, es toda sustancia o mezcla destinada a ser puesta en contacto con las partes superficiales del cuerpo humano (epidermis, sistema piloso y capilar, uñas, labios, órganos genitales externos) o con los dientes y mucosas bucales, con el fin exclusivo o principal de limpiarlos, perfumarlos, modificar su aspecto, protegerlos, mantenerlos en buen estado o corregir los olores corporales.”"
+    ],
+    "cosmetica para animales" : [
+        """Los productos destinados a la higiene o cuidado de animales no se consideran cosméticos y quedan fuera del ámbito de aplicación del Reglamento 1223/2009.
+            
+En el contexto español, estos productos fueron considerados inicialmente como productos zoosanitarios. Tras la publicación del Real Decreto 867/2020 dejaron de estar incluidos en dicho marco, aunque una sentencia del Tribunal Supremo en 2023 anuló parcialmente ese Real Decreto, devolviendo temporalmente a los productos cosméticos para animales la consideración de zoosanitarios.
+
+Finalmente, con la Ley 1/2025, de 1 de abril, que modifica la Ley 8/2003 de sanidad animal, se elimina la obligatoriedad de registro de los productos de higiene, cuidado y manejo de animales (HCM) y del material y utillaje zoosanitario (MUZ). En consecuencia, estos productos quedan fuera del ámbito competencial del Ministerio de Agricultura y Pesca.
+
+Ante esta situación, el pasado mes de junio nos pusimos en contacto con ASEMAZ, quienes nos informaron de lo siguiente:Con la publicación de la Ley 1/2025, determinados productos zoosanitarios destinados a higiene, cuidado y manejo de los animales ya no tienen que ser notificados por el titular de los mismos para su comercialización.
+
+Ahora bien, decimos “determinados” dado que dependiendo del “claim” reivindicado por el producto (biocidas), tendrán las siguientes obligaciones:
+
+**Registro nacional:**\n
+- Si se trata de un zoosanitario para uso en entorno ganadero (insecticida, larvicida, desinfectante, etc.), deberá solicitarse su registro ante el **MAPA** como plaguicida, con los correspondientes ensayos según la eficacia que se quiera defender.  
+  Más información: [Registro de productos zoosanitarios - MAPA](https://www.mapa.gob.es/es/ganaderia/temas/sanidad-animal-higiene-ganadera/Higiene-de-la-produccion-primaria-ganadera/registro-de-productos-zoosanitarios/)\n
+- Si se trata de un plaguicida no agrícola (desinfectante de uso en la industria alimentaria o uso ambiental, rodenticida, etc.), deberá solicitarse su registro ante **Sanidad** como plaguicida no agrícola.  
+  Más información: [Registro nacional de plaguicidas no agrícolas - Ministerio de Sanidad](https://www.sanidad.gob.es/areas/sanidadAmbiental/biocidas/registro/regNacional/requisitos_nacional.htm)\n
+- Si se trata de un **biocida tipo 3** (higiene veterinaria con función biocida), es obligatoria la notificación a Sanidad de conformidad con la **Disposición Transitoria Segunda del RD 1054/2002** (no requiere ensayos de eficacia).  
+  Más información: [Notificación DT2 - Ministerio de Sanidad](https://www.sanidad.gob.es/areas/sanidadAmbiental/biocidas/registro/regPlaguicidas/dt2notificanuevo.htm)\n
+
+En todo caso, para los casos anteriores, una vez que las sustancias activas que formen parte del producto (sustancias biocidas) cuenten con Reglamento de Ejecución para los tipos de productos biocidas que se quieren defender, esos productos deberán solicitar su registro por procedimiento europeo, de conformidad con las exigencias del Reglamento (UE) 528/2012.
+
+En todo caso, si los productos que se deseen comercializar estén afectados o no por lo indicado anteriormente, son productos químicos peligrosos (mezclas o sustancias) quedarán afectados por la normativa de clasificación y etiquetado de mezclas y sustancias químicas, debiendo estar debidamente etiquetados, contar con ficha de datos de seguridad (FDS) y ser notificados a toxicología a través de un expediente PCN.
+
+Por tanto, tal y como recomiendan desde ASEMAZ, lo más conveniente es poneros en contacto con la autoridad competente correspondiente para que os puedan dar información detallada."""
+    ],
+    "vitamina a": [
+        """De acuerdo con el Reglamento 1223/2009, para cualquier producto cosmético que contenga las sustancias 'Retinol', 'Retinyl Acetate' o 'Retinyl Palmitate', la mención **“Este producto contiene vitamina A. Tenga en cuenta su ingesta diaria antes de utilizarlo”** es obligatoria. 
+Por tanto, la advertencia debe figurar literalmente en el etiquetado del producto.""",
+        
+        """Entendemos que esta advertencia pueda generar cierta confusión en el consumidor, pero modificar la redacción obligatoria no es una opción, ya que debe figurar exactamente con la redacción establecida en el Reglamento. 
+No obstante, y siempre bajo criterio del evaluador de seguridad del producto, puede añadirse una advertencia complementaria que aclare que el producto es de uso cosmético y no debe ingerirse."""
+    ],
+    "e metrologica": [
+        """Según el Real Decreto 1801/2008, la inclusión del símbolo "℮" en el etiquetado de los envases **no es obligatoria**.  
+El artículo 9.c) establece que los envases que cumplen con las modalidades de control estadístico de lotes especificadas en el decreto pueden llevar el símbolo "℮", lo que certifica que el envase cumple con las disposiciones del mismo.
+
+Si el símbolo "℮" ya está presente en el envase secundario, **no es necesario incluirlo también en el envase primario**, siempre y cuando se garantice que el envase primario cumple con los requisitos de control establecidos.  
+Sin embargo, es recomendable que la información sea clara y accesible para el consumidor, por lo que se sugiere mantener la coherencia en el etiquetado de ambos envases."""
+    ]
+}
+
+# ==============================================
+# RESPUESTAS DE REDIRECCIÓN PREDEFINIDAS
+# ==============================================
+REDIRECCIONES_PREDEFINIDAS = {
+    "internacional": {
+        "respuesta": """\
+Buenos días,
+
+Para consultas relacionadas con terceros países pueden ayudaros mis compañeras del área internacional.  
+Lamentablemente, ellas aún no tienen acceso a la plataforma de Consultas Técnicas,  
+pero puedes escribirles a la siguiente dirección de correo electrónico:
+
+[stanpainternacional@stanpa.com](mailto:stanpainternacional@stanpa.com)
+
+Espero haber sido de utilidad y si necesita alguna cosa más, estamos a su disposición.
+
+Reciba un cordial saludo,  
+Departamento Técnico.
+"""
+    },
+    "sostenibilidad": {
+        "respuesta": """\
+Buenos días,
+
+En relación con tu consulta, lamentamos informarte que la responsable de Sostenibilidad,  
+quien podría ayudarte, no tiene acceso a la nueva plataforma de consultas técnicas.  
+No obstante, puedes dirigirte a ella a través del siguiente correo electrónico:
+
+[lucia.jimenez@stanpa.com](mailto:lucia.jimenez@stanpa.com)
+
+Espero haber sido de utilidad y si necesita alguna cosa más, estamos a su disposición.
+
+Reciba un cordial saludo,  
+Departamento Técnico.
+"""
+    }
+}
+
+
+ETIQUETAS_ORIGEN = {
+    "predefinida": "📌 Respuesta predefinida",
+    "excel": "📊 Basada en el histórico de consultas (Excel)",
+    "cache": "⚡ Recuperada de la caché de respuestas",
+    "generada": "✨ Generada a partir de la normativa",
+    "lexica": "🔤 Generada a partir de la normativa (búsqueda solo por palabras)",
+}
+
+DESPEDIDA = (
+    "Espero haber sido de utilidad y si necesita alguna cosa más, estamos a su disposición.\n\n"
+    "Reciba un cordial saludo,  \n"
+    "Departamento Técnico."
+)
+
+
+def saludo_para(hora=None):
+    hora = datetime.now().hour if hora is None else hora
+    return "Buenos días," if hora < 12 else "Buenas tardes,"
+
+
+class Contexto(NamedTuple):
+    fragmentos: list
+    emb_pregunta: object  # None si no hizo falta calcularlo
+    origen: str  # "excel" (coincidencia exacta o fuerte), "busqueda", "lexica" (sin embeddings) u "omitida"
+    fila: object = None  # fila de `pares` más parecida (None si no hubo búsqueda)
+    similitud: object = None  # su similitud (1.0 en coincidencia exacta)
+
+
+class Lexicos(NamedTuple):
+    indices: object  # filas del Excel, de mayor a menor BM25 (solo las que puntúan)
+    puntuaciones: object
+    indices_pdf: object  # fragmentos de PDF
+    puntuaciones_pdf: object
+
+
+class Preparada(NamedTuple):
+    trozos: object  # generador asíncrono con el texto según se genera
+    origen: str  # clave de ETIQUETAS_ORIGEN
+    ruta: str  # tema de la regla aplicada, o "busqueda"
+    contexto: object  # Contexto recuperado (None si la respuesta es predefinida)
+
+
+async def un_trozo(texto):
+    yield texto
+
+
+# ==============================================
+# 7️⃣ Ajustes de formato (aplicados según llega el texto)
+# ==============================================
+MARCAS_FIRMA = ("departamento técnico", "reciba un cordial saludo")
+RE_SALUDO_MODELO = re.compile(r"\s*(?:buenos d[ií]as|buenas tardes)\s*[,.:!]?\s*", re.IGNORECASE)
+
+
+def quitar_saludo(texto):
+    """Quita el saludo con el que empiece el modelo (el saludo lo pone la app)."""
+    coincidencia = RE_SALUDO_MODELO.match(texto)
+    return texto[coincidencia.end():] if coincidencia else texto.lstrip()
+
+
+def recortar_firma(texto):
+    """Corta el texto en la última aparición de la primera marca de firma que contenga."""
+    minusculas = texto.lower()
+    for marca in MARCAS_FIRMA:
+        if marca in minusculas:
+            return texto[:minusculas.rfind(marca)].strip()
+    return texto
+
+
+async def formatear_en_streaming(tokens, saludo, despedida, traza=TRAZA_NULA):
+    """Da forma a la salida del modelo a medida que llega.
+
+    El saludo sale de inmediato. Del texto se retiene solo lo necesario para
+    quitar el saludo que ponga el modelo y no mostrar nunca el comienzo de
+    una firma; al terminar se recorta la firma con `recortar_firma` (que solo
+    puede cortar por detrás de lo ya mostrado) y se añade la despedida.
+    El tiempo de proceso propio (sin esperar tokens) va a la etapa "formato".
+    """
+    yield f"{saludo}\n\n"
+    margen = max(len(marca) for marca in MARCAS_FIRMA)
+    bruto, emitido = "", 0
+    async for token in tokens:
+        inicio = time.perf_counter()
+        bruto += token
+        if len(bruto.lstrip()) < margen:
+            continue  # todavía no se sabe si empieza con un saludo
+        cuerpo = quitar_saludo(bruto)
+        minusculas = cuerpo.lower()
+        # Se retienen los últimos caracteres por si son el principio de una marca
+        seguro = len(cuerpo) - margen + 1
+        for marca in MARCAS_FIRMA:
+            posicion = minusculas.find(marca)
+            if posicion != -1:
+                seguro = min(seguro, posicion)
+        traza.sumar("formato", time.perf_counter() - inicio)
+        if seguro > emitido:
+            yield cuerpo[emitido:seguro]
+            emitido = seguro
+    with traza.etapa("formato"):
+        cuerpo = recortar_firma(quitar_saludo(bruto.strip()))
+    yield f"{cuerpo[emitido:]}\n\n{despedida}"
+
+
+async def _trazar(trozos, traza):
+    """Pasa los trozos y cierra la traza al terminar (o al abandonarse la respuesta)."""
+    error = None
+    try:
+        async for trozo in trozos:
+            yield trozo
+    except GeneratorExit:
+        traza.anotar(cancelada=True)
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        traza.terminar(error)
+
+
+def _cronometrado(etapa, funcion, *args):
+    """Llama a `funcion(*args)` sumando su duración a `etapa` de la traza en curso."""
+    with traza_actual().etapa(etapa):
+        return funcion(*args)
+
+
+def _mejores(motor, emb_pregunta, candidatos, k):
+    """Top-k por similitud coseno entre `candidatos`, sin recorrer toda la matriz."""
+    similitudes = motor.similitudes_filas(emb_pregunta, candidatos)
+    orden = np.argsort(-similitudes, kind="stable")[:k]
+    return np.asarray(candidatos)[orden], similitudes[orden]
+
+
+def _fusionar_con(motor, emb_pregunta, indices, similitudes, candidatos_lexicos, k):
+    """Fusiona el top-k denso con el léxico; devuelve (índices, similitudes coseno).
+
+    La fila más parecida por embeddings se conserva siempre, porque decide la
+    coincidencia fuerte; las que solo aporta BM25 se puntúan con embeddings
+    para que los umbrales sigan siendo de similitud coseno.
+    """
+    filas = fusionar(indices, candidatos_lexicos, k)
+    if len(indices) and int(indices[0]) not in filas:
+        filas[-1] = int(indices[0])
+    conocidas = dict(zip(np.asarray(indices).tolist(), np.asarray(similitudes).tolist()))
+    nuevas = [fila for fila in filas if fila not in conocidas]
+    conocidas.update(zip(nuevas, motor.similitudes_filas(emb_pregunta, nuevas).tolist()))
+    return np.asarray(filas, dtype=np.intp), np.asarray([conocidas[fila] for fila in filas], dtype=np.float32)
+
+
+def construir_prompt(pregunta, fragmentos, conversacion=""):
+    """Devuelve (contexto textual, prompt) del caso general."""
+    texto_contexto = "\n\n".join(fragmentos) if fragmentos else ""
+    previa = ""
+    if conversacion:
+        previa = f"""Conversación previa (úsala solo para entender a qué se refiere la pregunta):
+{conversacion}
+
+"""
+    prompt = f"""
+Eres un asistente técnico experto en legislación cosmética, biocidas y productos regulados.
+Redacta una respuesta formal, precisa y técnica, pero **no incluyas fórmulas de cortesía como 'Estimado/a' ni nombres del remitente.**
+Tampoco incluyas una firma con nombres personales; la respuesta debe cerrarse con 'Departamento Técnico.'
+Empieza la respuesta directamente tras el saludo y no incluyas saludos ni cierres redundantes.
+
+{previa}Contexto normativo: {texto_contexto}
+Pregunta: {pregunta}
+"""
+    return texto_contexto, prompt
+
+
+# ==============================================
+# 💬 Conversación previa
+# ==============================================
+def tokens_aproximados(texto):
+    return len(texto) // CARACTERES_POR_TOKEN + 1
+
+
+def _turnos(historial, max_turnos):
+    """Últimos `max_turnos` pares (pregunta, respuesta) de un historial de mensajes role/content."""
+    turnos, respuesta = [], None
+    # Solo se mira el final: el coste no depende de la longitud de la sesión
+    for mensaje in reversed(historial[-2 * max_turnos - 1:]):
+        if mensaje["role"] == "assistant":
+            respuesta = mensaje["content"]
+        elif respuesta is not None:
+            turnos.append((mensaje["content"], respuesta))
+            respuesta = None
+    return turnos[:max_turnos][::-1]
+
+
+def resumir_historial(historial, presupuesto=PRESUPUESTO_HISTORIAL, max_turnos=MAX_TURNOS_HISTORIAL):
+    """Texto con los últimos turnos de la conversación que caben en `presupuesto` tokens.
+
+    Se llena desde el turno más reciente; las respuestas van sin saludo ni
+    firma y se recortan si no caben enteras. Los turnos más antiguos se omiten.
+    """
+    if not historial:
+        return ""
+    bloques, restante = [], presupuesto
+    for pregunta, respuesta in reversed(_turnos(historial, max_turnos)):
+        linea_pregunta = f"Usuario: {pregunta}"
+        disponible = restante - tokens_aproximados(linea_pregunta)
+        if disponible <= 0:
+            break
+        respuesta = recortar_firma(quitar_saludo(respuesta.strip().removesuffix(DESPEDIDA))).strip()
+        if tokens_aproximados(respuesta) > disponible:
+            respuesta = respuesta[:disponible * CARACTERES_POR_TOKEN].rsplit(" ", 1)[0] + "…"
+        bloque = f"{linea_pregunta}\nAsistente: {respuesta}"
+        bloques.append(bloque)
+        restante -= tokens_aproximados(bloque)
+    return "\n\n".join(reversed(bloques))
+
+
+def es_seguimiento(pregunta):
+    """Si la pregunta parece continuar la anterior y no se entiende sola.
+
+    >>> [es_seguimiento(p) for p in ("¿Y en niños?", "¿Eso aplica también a los champús?", "¿Pero hay que notificarlo?")]
+    [True, True, True]
+    >>> [es_seguimiento(p) for p in ("Etiquetado de cosméticos", "¿Qué es CPNP?", "Hola")]
+    [False, False, False]
+    """
+    canonica = normalizar_texto(pregunta)
+    return len(canonica.split()) <= MAX_PALABRAS_SEGUIMIENTO and RE_SEGUIMIENTO.search(canonica) is not None
+
+
+def consulta_de_busqueda(pregunta, historial):
+    """Texto con el que se busca: en preguntas de seguimiento se antepone la pregunta anterior."""
+    if historial and es_seguimiento(pregunta):
+        anterior = next((m["content"] for m in reversed(historial) if m["role"] == "user"), None)
+        if anterior:
+            return f"{anterior} {pregunta}"
+    return pregunta
+
+
+# ==============================================
+# 5️⃣ FUNCIÓN PRINCIPAL
+# ==============================================
+class Chatbot:
+    """Responde preguntas con una base de conocimiento y un ClienteOpenAI.
+
+    Las corrutinas deben correr en el bucle del cliente (cliente.ejecutar
+    desde código síncrono). Las cachés son opcionales: sin ellas cada
+    pregunta llama a la API. Con `trazas` (un RegistroTrazas) cada
+    respuesta deja una traza con sus tiempos por etapa. `recuperacion` es
+    uno de MODOS_RECUPERACION; los modos con BM25 solo se aplican si el
+    índice incluye el léxico.
+    """
+
+    def __init__(
+        self, kb, cliente, cache_embeddings=None, cache_respuestas=None, enrutador=MOTOR, trazas=None,
+        recuperacion=RECUPERACION, limite_embedding=LIMITE_EMBEDDING,
+    ):
+        if recuperacion not in MODOS_RECUPERACION:
+            raise ValueError(
+                f"Modo de recuperación desconocido: {recuperacion!r} (opciones: {', '.join(MODOS_RECUPERACION)})"
+            )
+        self.kb = kb
+        self.cliente = cliente
+        self.cache_embeddings = cache_embeddings
+        self.cache_respuestas = cache_respuestas
+        self.enrutador = enrutador
+        self.trazas = trazas
+        self.recuperacion = recuperacion
+        self.limite_embedding = limite_embedding
+
+    @property
+    def usa_lexico(self):
+        return self.kb.lexico is not None and self.recuperacion != "densa"
+
+    @property
+    def modelo_embeddings(self):
+        return self.kb.indice.manifiesto["modelo"]
+
+    # ------------------------------------------------------------------
+    # 4️⃣ Buscar contexto relevante con embeddings
+    # ------------------------------------------------------------------
+    async def embeber_pregunta(self, pregunta_normalizada, limite=None):
+        """Embedding de la pregunta con el modelo del índice, pasando por la caché.
+
+        `limite` acota la llamada a la API (ver ClienteOpenAI.embedding).
+        """
+        modelo = self.modelo_embeddings
+        traza = traza_actual()
+        with traza.etapa("embedding"):
+            if self.cache_embeddings is None:
+                return await self.cliente.embedding(pregunta_normalizada, modelo, limite)
+
+            llamadas_api = []
+
+            def calcular(texto):
+                llamadas_api.append(texto)
+                return self.cliente.ejecutar(self.cliente.embedding(texto, modelo, limite))
+
+            # La caché es síncrona (SQLite + espera a peticiones en vuelo): va en un hilo
+            vector = await asyncio.to_thread(
+                self.cache_embeddings.obtener, pregunta_normalizada, calcular, modelo=modelo
+            )
+        traza.anotar_cache("embeddings", not llamadas_api)
+        return vector
+
+    async def embeber_con_respaldo(self, pregunta_normalizada):
+        """Como `embeber_pregunta`, pero con índice léxico devuelve None si la
+        API falla o tarda más de `limite_embedding` (se responde con BM25).
+        La espera por un hueco del cliente no cuenta: la cola propia no es un
+        fallo de la API."""
+        if not self.usa_lexico:
+            return await self.embeber_pregunta(pregunta_normalizada)
+        try:
+            return await self.embeber_pregunta(pregunta_normalizada, self.limite_embedding)
+        except (asyncio.TimeoutError, OpenAIError) as e:
+            print(f"⚠️ Embeddings no disponibles ({type(e).__name__}) — se busca solo por palabras.")
+            traza_actual().anotar(respaldo_lexico=True)
+            return None
+
+    def buscar_lexico(self, texto, top_k=TOP_K, top_k_pdf=TOP_K_PDF):
+        """Mejores filas del Excel y fragmentos de PDF por BM25, o None si no se usa el índice léxico."""
+        if not self.usa_lexico:
+            return None
+        lexico, n = self.kb.lexico, len(self.kb.pares)
+        puntuaciones = lexico.puntuar(texto)
+        return Lexicos(*lexico.buscar(puntuaciones, top_k, hasta=n), *lexico.buscar(puntuaciones, top_k_pdf, desde=n))
+
+    def combinar_lexicos(self, emb_pregunta, densos, lexicos, top_k=TOP_K, top_k_pdf=TOP_K_PDF):
+        """(índices, similitudes, índices_pdf, similitudes_pdf) fusionando el top-k denso con BM25."""
+        indices, similitudes, indices_pdf, similitudes_pdf = densos
+        kb = self.kb
+        return (
+            *_fusionar_con(kb.busqueda_consultas, emb_pregunta, indices, similitudes, lexicos.indices, top_k),
+            *_fusionar_con(kb.busqueda_pdfs, emb_pregunta, indices_pdf, similitudes_pdf, lexicos.indices_pdf, top_k_pdf),
+        )
+
+    def filtrar_lexicos(self, emb_pregunta, lexicos, top_k=TOP_K, top_k_pdf=TOP_K_PDF):
+        """Como `combinar_lexicos`, pero puntuando con embeddings solo los candidatos de BM25."""
+        kb = self.kb
+        return (
+            *_mejores(kb.busqueda_consultas, emb_pregunta, lexicos.indices, top_k),
+            *_mejores(kb.busqueda_pdfs, emb_pregunta, lexicos.indices_pdf, top_k_pdf),
+        )
+
+    def contexto_sin_embeddings(self, pregunta):
+        """Contexto que no necesita embedding (tema ℮ o coincidencia exacta), o None."""
+        traza = traza_actual()
+        # Evita que use embeddings para temas tratados explícitamente
+        with traza.etapa("enrutado"):
+            temas = self.enrutador.detectar(normalizar_enrutado(pregunta), contar=False)
+        if any(ruta.manejador == "e_metrologica" for ruta in temas):
+            print("🔒 Saltando búsqueda por embeddings (tema e metrológica).")
+            return Contexto([], None, "omitida")
+
+        # ✅ Coincidencia literal exacta (antes de usar embeddings)
+        with traza.etapa("exacta"):
+            filas_exactas = self.kb.buscar_exacta(pregunta)
+        if filas_exactas:
+            print("✅ Coincidencia exacta encontrada — usando respuesta literal del Excel.")
+            fila = filas_exactas[0]
+            return Contexto([self.kb.pares[fila][1]], None, "excel", fila, 1.0)
+        return None
+
+    def contexto_de_busqueda(
+        self, emb_pregunta, indices, similitudes, indices_pdf, similitudes_pdf,
+        umbral_similitud=UMBRAL_SIMILITUD, umbral_pdf=UMBRAL_PDF,
+    ):
+        """Contexto a partir de los top-k del Excel y de los PDFs de una pregunta."""
+        kb = self.kb
+        # Con BM25 el orden es el de la fusión: la coincidencia fuerte se decide por similitud
+        mejor = int(np.argmax(similitudes)) if len(indices) else None
+        fila = int(indices[mejor]) if mejor is not None else None
+        similitud = float(similitudes[mejor]) if mejor is not None else None
+        traza_actual().anotar(
+            similitudes_excel=[round(float(s), 4) for s in similitudes[:3]],
+            similitudes_pdf=[round(float(s), 4) for s in similitudes_pdf[:3]],
+        )
+
+        if fila is not None and similitud >= umbral_similitud:
+            print(f"✅ Coincidencia fuerte ({similitud:.2f}) — usando respuesta del Excel.")
+            return Contexto([kb.pares[fila][1]], emb_pregunta, "excel", fila, similitud)
+
+        print("⚠️ No se encontró coincidencia fuerte — se generará respuesta nueva.")
+        # Si no hay coincidencia fuerte, probar también con PDFs
+        contextos = [kb.pares[i][1] for i in indices]
+
+        # 🔹 Añadir los fragmentos de PDF que superen el umbral
+        for idx_pdf, similitud_pdf in zip(indices_pdf, similitudes_pdf):
+            if similitud_pdf >= umbral_pdf:
+                contextos.append(self._fragmento_pdf(idx_pdf, similitud_pdf))
+
+        return Contexto(contextos, emb_pregunta, "busqueda", fila, similitud)
+
+    def contexto_lexico(self, lexicos, top_k=TOP_K, top_k_pdf=TOP_K_PDF):
+        """Contexto solo con BM25, para cuando no hay embedding de la pregunta."""
+        indices = lexicos.indices[:top_k]
+        contextos = [self.kb.pares[i][1] for i in indices]
+        for idx_pdf, puntuacion in zip(lexicos.indices_pdf[:top_k_pdf], lexicos.puntuaciones_pdf):
+            contextos.append(self._fragmento_pdf(idx_pdf, puntuacion))
+        fila = int(indices[0]) if len(indices) else None
+        return Contexto(contextos, None, "lexica", fila)
+
+    def _fragmento_pdf(self, idx_pdf, puntuacion):
+        meta = self.kb.fragmentos_pdf.iloc[idx_pdf]
+        cita = f"{meta['fuente']}, pág. {meta['pagina']}"
+        if isinstance(meta["seccion"], str) and meta["seccion"]:
+            cita += f" — {meta['seccion']}"
+        print(f"📄 Coincidencia PDF encontrada en {cita} ({puntuacion:.2f})")
+        # El texto del fragmento se lee del índice solo cuando se usa
+        return f"[{cita}]\n{self.kb.texto_fragmento(idx_pdf)}"
+
+    async def _buscar_en_pdfs(self, emb_pregunta, top_k):
+        if not self.kb.nombres_pdf:
+            return [], []
+        return await asyncio.to_thread(_cronometrado, "pdfs", self.kb.busqueda_pdfs.buscar, emb_pregunta, top_k)
+
+    async def buscar_contexto(
+        self, pregunta, top_k=TOP_K, umbral_similitud=UMBRAL_SIMILITUD, top_k_pdf=TOP_K_PDF, umbral_pdf=UMBRAL_PDF,
+        consulta=None,
+    ):
+        """Contexto de `pregunta`; `consulta` (p. ej. con la pregunta anterior) sustituye al texto buscado."""
+        contexto = self.contexto_sin_embeddings(pregunta)
+        if contexto is not None:
+            return contexto
+
+        # 🔹 Si no hay coincidencia exacta, usar embeddings (una sola llamada por
+        # pregunta) y, mientras llega, BM25, que también sirve de respaldo sin API
+        consulta = consulta or pregunta
+        filtrada = self.recuperacion == "filtrada"
+        lexicos, emb_pregunta = await asyncio.gather(
+            asyncio.to_thread(
+                _cronometrado, "lexica", self.buscar_lexico, consulta,
+                CANDIDATOS_FILTRO if filtrada else top_k, CANDIDATOS_FILTRO if filtrada else top_k_pdf,
+            ),
+            self.embeber_con_respaldo(normalizar_embedding(consulta)),
+        )
+        if emb_pregunta is None:
+            return self.contexto_lexico(lexicos, top_k, top_k_pdf)
+
+        if filtrada and lexicos is not None and len(lexicos.indices) >= top_k:
+            resultados = await asyncio.to_thread(
+                _cronometrado, "busqueda", self.filtrar_lexicos, emb_pregunta, lexicos, top_k, top_k_pdf
+            )
+        else:
+            # Top-k por similitud coseno (vectores ya normalizados): Excel y PDFs a la
+            # vez; la de PDFs solo se usa si no hay coincidencia fuerte
+            (indices, similitudes), (indices_pdf, similitudes_pdf) = await asyncio.gather(
+                asyncio.to_thread(_cronometrado, "busqueda", self.kb.busqueda_consultas.buscar, emb_pregunta, top_k),
+                self._buscar_en_pdfs(emb_pregunta, top_k_pdf),
+            )
+            resultados = (indices, similitudes, indices_pdf, similitudes_pdf)
+            if lexicos is not None:
+                resultados = self.combinar_lexicos(emb_pregunta, resultados, lexicos, top_k, top_k_pdf)
+        return self.contexto_de_busqueda(emb_pregunta, *resultados, umbral_similitud, umbral_pdf)
+
+    # ------------------------------------------------------------------
+    # Generación
+    # ------------------------------------------------------------------
+    async def generar_en_streaming(self, prompt, temperatura, traza=TRAZA_NULA):
+        """Tokens de gpt-4o-mini según llegan; registra el tiempo hasta el primero."""
+        inicio = time.perf_counter()
+        primer_token = None
+        uso = {}
+        async for token in self.cliente.completar_stream(prompt, temperatura, uso=uso):
+            if primer_token is None:
+                primer_token = time.perf_counter() - inicio
+                print(f"⏱️ Primer token en {primer_token * 1000:.0f} ms")
+                traza.sumar("primer_token", primer_token)
+                traza.marcar("primer_token_peticion")
+            yield token
+        traza.sumar("completado", time.perf_counter() - inicio)
+        traza.anotar_tokens(**uso)
+        print(f"⏱️ Respuesta completa en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+    async def completar_con_cache(self, pregunta, emb_pregunta, contexto, prompt, temperatura):
+        """Devuelve (tokens, de_cache).
+
+        Si hay una respuesta cacheada para una pregunta equivalente con el mismo
+        contexto, `tokens` la contiene en un único trozo; si no, son los tokens
+        del modelo según llegan y, al agotarlos, la respuesta completa se guarda.
+        """
+        # Los tokens se piden desde otras tareas: la traza se pasa explícitamente
+        traza = traza_actual()
+        if self.cache_respuestas is None:
+            return self.generar_en_streaming(prompt, temperatura, traza), False
+
+        cache, version = self.cache_respuestas, self.kb.version
+        pregunta_canonica = normalizar_texto(pregunta)
+        clave_contexto = hash_contexto(contexto)
+        texto = await asyncio.to_thread(
+            _cronometrado, "cache_respuestas", cache.buscar, pregunta_canonica, emb_pregunta, clave_contexto, version
+        )
+        traza.anotar_cache("respuestas", texto is not None)
+        if texto is not None:
+            print("⚡ Respuesta recuperada de la caché.")
+            return un_trozo(texto), True
+
+        async def tokens():
+            partes = []
+            async for token in self.generar_en_streaming(prompt, temperatura, traza):
+                partes.append(token)
+                yield token
+            # Si el usuario abandona a mitad, el generador se cierra y no se guarda nada
+            await asyncio.to_thread(
+                cache.guardar, pregunta_canonica, emb_pregunta, clave_contexto, version, "".join(partes).strip()
+            )
+
+        return tokens(), False
+
+    async def preparar_respuesta(self, pregunta, contexto=None, hora=None, historial=None):
+        """Enruta la pregunta, recupera el contexto y consulta la caché.
+
+        `contexto` permite pasar uno ya recuperado (p. ej. en lote) e
+        `historial` los mensajes anteriores de la conversación (role/content);
+        sus últimos turnos solo se usan si la pregunta es de seguimiento
+        (`es_seguimiento`), así las demás comparten la caché de respuestas
+        con las de cualquier otra sesión. La llamada al modelo empieza al
+        pedir el primer trozo de `trozos`; la traza se cierra al agotarlos.
+        """
+        traza = self.trazas.nueva(pregunta) if self.trazas is not None else TRAZA_NULA
+        activar(traza)
+        try:
+            preparada = await self._preparar(pregunta, contexto, hora, historial)
+        except BaseException as e:
+            traza.terminar(e)
+            raise
+        traza.anotar(ruta=preparada.ruta, origen=preparada.origen)
+        if preparada.contexto is not None:
+            traza.anotar(fila=preparada.contexto.fila, similitud=preparada.contexto.similitud)
+        return preparada._replace(trozos=_trazar(preparada.trozos, traza))
+
+    async def _preparar(self, pregunta, contexto, hora, historial):
+        traza = traza_actual()
+        saludo = saludo_para(hora)
+        despedida = DESPEDIDA
+
+        # 🔹 Limpieza y normalización de texto (forma del enrutado, ver normalizar_enrutado)
+        pregunta_sin_acentos = normalizar_enrutado(pregunta)
+
+        # ======================================================
+        # 🔹 1️⃣-5️⃣ Temas con respuesta predefinida (ver enrutado.RUTAS)
+        # ======================================================
+        with traza.etapa("enrutado"):
+            ruta = self.enrutador.enrutar(pregunta_sin_acentos)
+
+        # Redirecciones: internacional, sostenibilidad...
+        if ruta and ruta.manejador == "redireccion":
+            texto = REDIRECCIONES_PREDEFINIDAS[ruta.tema]["respuesta"]
+            return Preparada(un_trozo(texto), "predefinida", ruta.tema, None)
+
+        # Temas específicos: vitamina A, cosmética para animales...
+        if ruta and ruta.manejador == "frases":
+            texto = "\n\n".join(FRASES_POR_TEMA[ruta.tema])
+            return Preparada(un_trozo(f"{saludo}\n\n{texto}\n\n{despedida}"), "predefinida", ruta.tema, None)
+
+        # Detección de “℮” metrológica
+        if ruta and ruta.manejador == "e_metrologica":
+            print("✅ Tema detectado: e metrológica")
+            texto_base = "\n\n".join(FRASES_POR_TEMA["e metrologica"])
+
+            # Si la consulta no es más amplia, basta la respuesta base
+            if not re.search(r'(ademas|otra|tambien|aparte)', pregunta_sin_acentos):
+                return Preparada(
+                    un_trozo(f"{saludo}\n\n{texto_base}\n\n{despedida}"), "predefinida", ruta.tema, None
+                )
+
+            # Si lo es, añade párrafo complementario
+            prompt = f"""
+Eres un experto en legislación cosmética y etiquetado.
+La siguiente respuesta ya es correcta y está aprobada:
+
+--- RESPUESTA BASE ---
+{texto_base}
+----------------------
+
+El usuario ha hecho una consulta más amplia:
+{pregunta}
+
+Redacta SOLO un párrafo adicional complementario (si procede),
+sin modificar ni repetir la respuesta base.
+Si no hay nada relevante que añadir, responde con una frase breve confirmando que la respuesta base es suficiente.
+"""
+            # Sin embedding: este tema no lo necesita y la caché basta con la pregunta canónica
+            complemento, de_cache = await self.completar_con_cache(pregunta, None, texto_base, prompt, 0.2)
+
+            async def trozos():
+                yield f"{saludo}\n\n{texto_base}\n\n"
+                async for token in complemento:
+                    yield token
+                yield f"\n\n{despedida}"
+
+            return Preparada(trozos(), "cache" if de_cache else "generada", ruta.tema, None)
+
+        # ======================================================
+        # 🔹 6️⃣ Caso general: búsqueda por embeddings
+        # ======================================================
+        # La conversación solo entra si la pregunta no se entiende sola
+        historial = historial if historial and es_seguimiento(pregunta) else None
+        traza.anotar(seguimiento=historial is not None)
+        conversacion = resumir_historial(historial)
+        if contexto is None:
+            consulta = consulta_de_busqueda(pregunta, historial)
+            contexto = await self.buscar_contexto(pregunta, consulta=consulta)
+        texto_contexto, prompt = construir_prompt(pregunta, contexto.fragmentos, conversacion)
+        if conversacion:
+            traza.anotar(tokens_historial=tokens_aproximados(conversacion))
+            # La conversación cambia la respuesta: forma parte de la clave de la caché
+            texto_contexto = f"{texto_contexto}\n\n{conversacion}"
+        # La salida del modelo se cachea sin saludo ni despedida (dependen de la hora)
+        tokens, de_cache = await self.completar_con_cache(
+            pregunta, contexto.emb_pregunta, texto_contexto, prompt, 0.1
+        )
+        if de_cache:
+            origen = "cache"
+        else:
+            origen = contexto.origen if contexto.origen in ("excel", "lexica") else "generada"
+        return Preparada(formatear_en_streaming(tokens, saludo, despedida, traza), origen, "busqueda", contexto)
+
+    async def responder(self, pregunta, contexto=None, historial=None):
+        """Devuelve (respuesta completa, Preparada)."""
+        preparada = await self.preparar_respuesta(pregunta, contexto, historial=historial)
+        return "".join([trozo async for trozo in preparada.trozos]), preparada
@@ -0,0 +1,109 @@
+# ==============================================
+# 📄 Lectura y troceado de PDFs normativos
+# Página a página, en fragmentos solapados con nº de página y sección
+# ==============================================
+
+import re
+from typing import NamedTuple
+
+import fitz  # PyMuPDF
+
+MAX_TOKENS_FRAGMENTO = 400
+SOLAPE_TOKENS = 80
+
+# Aproximación de tokens: palabras y signos de puntuación sueltos
+RE_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Encabezados que abren una sección: artículos, anexos, capítulos, apartados numerados
+RE_ENCABEZADO = re.compile(
+    r"^("
+    r"(Art[ií]culo|ART[IÍ]CULO|Article|ARTICLE|Anexo|ANEXO|Annex|ANNEX|Cap[ií]tulo|CAP[IÍ]TULO"
+    r"|Chapter|CHAPTER|Secci[oó]n|SECCI[OÓ]N|Section|SECTION|T[ií]tulo|T[IÍ]TULO)"
+    r"\s+[\dIVXLC]+[A-Za-z]?\b[.ºª]?(\s+[A-ZÁÉÍÓÚÑ(].*)?"
+    r"|\d{1,2}(\.\d{1,2})+\.?\s+[A-ZÁÉÍÓÚÑ][^.]*"
+    r"|\d{1,2}\.\s+[A-ZÁÉÍÓÚÑ][A-ZÁÉÍÓÚÑ\s,-]*"
+    r")$"
+)
+MAX_CARACTERES_ENCABEZADO = 120
+
+
+class Fragmento(NamedTuple):
+    pagina_inicio: int
+    pagina_fin: int
+    seccion: str
+    texto: str
+
+
+def contar_tokens(texto):
+    return len(RE_TOKEN.findall(texto))
+
+
+def paginas(ruta_pdf):
+    """Genera (nº de página empezando en 1, texto) sin cargar el documento entero."""
+    with fitz.open(ruta_pdf) as pdf:
+        for numero, pagina in enumerate(pdf, start=1):
+            yield numero, pagina.get_text()
+
+
+def es_encabezado(linea):
+    linea = linea.strip()
+    # Las líneas de índice ("Annex C ........ 39") no abren sección
+    return (
+        0 < len(linea) <= MAX_CARACTERES_ENCABEZADO
+        and "..." not in linea
+        and bool(RE_ENCABEZADO.match(linea))
+    )
+
+
+def _lineas(ruta_pdf, max_tokens):
+    """Genera (página, sección vigente, línea, tokens), partiendo las líneas demasiado largas."""
+    seccion = ""
+    for numero, texto in paginas(ruta_pdf):
+        for linea in texto.splitlines():
+            linea = linea.strip()
+            if not linea:
+                continue
+            if es_encabezado(linea):
+                seccion = linea
+            palabras = linea.split()
+            for i in range(0, len(palabras), max_tokens):
+                trozo = " ".join(palabras[i:i + max_tokens])
+                yield numero, seccion, trozo, contar_tokens(trozo)
+
+
+def trocear_pdf(ruta_pdf, max_tokens=MAX_TOKENS_FRAGMENTO, solape=SOLAPE_TOKENS):
+    """Genera fragmentos de como mucho ~`max_tokens` con `solape` tokens repetidos.
+
+    Cada fragmento conserva las páginas que abarca y el último encabezado
+    (artículo, anexo...) visto antes de su comienzo. Solo se mantiene en
+    memoria el fragmento en curso.
+    """
+    ventana = []  # (página, sección, línea, tokens)
+    tokens = 0
+
+    def emitir():
+        return Fragmento(
+            pagina_inicio=ventana[0][0],
+            pagina_fin=ventana[-1][0],
+            seccion=ventana[0][1],
+            texto="\n".join(linea for _, _, linea, _ in ventana),
+        )
+
+    for elemento in _lineas(ruta_pdf, max_tokens):
+        if ventana and tokens + elemento[3] > max_tokens:
+            yield emitir()
+            # Se conservan las últimas líneas como solape con el siguiente fragmento
+            conservadas, acumulado = [], 0
+            for previo in reversed(ventana):
+                if acumulado + previo[3] > solape:
+                    break
+                conservadas.insert(0, previo)
+                acumulado += previo[3]
+            if acumulado + elemento[3] > max_tokens:
+                conservadas, acumulado = [], 0
+            ventana, tokens = conservadas, acumulado
+        ventana.append(elemento)
+        tokens += elemento[3]
+
+    if ventana:
+        yield emitir()
@@ -0,0 +1,300 @@
+# ==============================================
+# 🗂️ Respuesta en lote de un fichero de consultas
+# Uso: python responder_lote.py consultas.xlsx resultados.jsonl
+# (xlsx, csv o jsonl; si se interrumpe, al relanzarlo continúa donde iba)
+# ==============================================
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+import numpy as np
+import openpyxl
+from openai import OpenAIError
+
+from base_conocimiento import CARPETA_PDFS, MODO_BUSQUEDA, RUTA_EXCEL, cargar_base_conocimiento
+from cache import CacheRespuestas
+from cliente_openai import CONCURRENCIA, ClienteOpenAI
+from indice import DIRECTORIO_INDICE
+from normalizacion import normalizar_embedding, normalizar_enrutado
+from nucleo import MODOS_RECUPERACION, RECUPERACION, TOP_K, TOP_K_PDF, Chatbot
+from trazas import RegistroTrazas
+
+# Preguntas que se recuperan juntas (una petición de embeddings y una GEMM por bloque)
+TAM_BLOQUE = 256
+# Textos por petición de embeddings
+TAM_LOTE_EMBEDDINGS = 256
+# Clave con la pregunta en los JSONL si no se indica --columna
+CLAVE_JSONL = "pregunta"
+# Columna o clave con el identificador propio de cada pregunta, si lo hay
+CLAVE_ID = "id"
+
+
+# ==============================================
+# 📥 Lectura de preguntas por partes
+# ==============================================
+def _filas_xlsx(ruta):
+    libro = openpyxl.load_workbook(ruta, read_only=True)
+    try:
+        yield from libro.active.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def _filas_csv(ruta):
+    with open(ruta, newline="", encoding="utf-8-sig") as f:
+        yield from csv.reader(f)
+
+
+def _registros(filas, columna):
+    """Convierte filas con cabecera en diccionarios {cabecera en minúsculas: valor}."""
+    filas = iter(filas)
+    cabecera = [str(c or "").strip().lower() for c in next(filas, [])]
+    if columna and columna not in cabecera:
+        raise ValueError(f"No existe la columna '{columna}' (columnas: {', '.join(cabecera)})")
+    for fila in filas:
+        yield dict(zip(cabecera, fila))
+
+
+def _registros_jsonl(ruta, columna):
+    """Objetos de un JSONL con las claves en minúsculas; una línea que no es
+    un objeto se toma como la pregunta. Las líneas mal formadas se omiten con aviso."""
+    clave = columna or CLAVE_JSONL
+    with open(ruta, encoding="utf-8") as f:
+        for numero, linea in enumerate(f, 1):
+            if not linea.strip():
+                continue
+            try:
+                dato = json.loads(linea)
+            except json.JSONDecodeError as e:
+                print(f"⚠️ Línea {numero} de {ruta} omitida: JSON no válido ({e.msg}).")
+                continue
+            if not isinstance(dato, dict):
+                yield {clave: dato}
+                continue
+            registro = {str(k).strip().lower(): v for k, v in dato.items()}
+            conversacion = columna is None and "role" in registro and "content" in registro
+            if not conversacion and clave not in registro:
+                raise ValueError(
+                    f"La línea {numero} de {ruta} no tiene la clave '{clave}' (claves: {', '.join(registro)})"
+                )
+            yield registro
+
+
+def leer_preguntas(ruta, columna=None):
+    """Genera (id, pregunta, id_entrada) leyendo el fichero por partes.
+
+    La columna por defecto es la primera (en JSONL, la clave "pregunta"),
+    salvo en ficheros con el formato de conversaciones_revisando.xlsx
+    (role/content), donde se toman los mensajes con role "user". El id es la
+    posición de la pregunta en el fichero (con él se reanuda) e `id_entrada`
+    el valor de la columna "id" del registro, o None si no la tiene.
+    """
+    columna = columna.strip().lower() if columna else None
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == ".jsonl":
+        registros = _registros_jsonl(ruta, columna)
+    elif extension == ".csv":
+        registros = _registros(_filas_csv(ruta), columna)
+    elif extension in (".xlsx", ".xlsm"):
+        registros = _registros(_filas_xlsx(ruta), columna)
+    else:
+        raise ValueError(f"Formato no soportado: {extension} (xlsx, csv o jsonl)")
+
+    n = 0
+    for registro in registros:
+        if columna is None and "role" in registro and "content" in registro:
+            if str(registro["role"]).strip().lower() != "user":
+                continue
+            pregunta = registro["content"]
+        elif columna or extension == ".jsonl":
+            pregunta = registro.get(columna or CLAVE_JSONL)
+        else:
+            pregunta = next(iter(registro.values()), None)
+        if pregunta is None or not str(pregunta).strip():
+            continue
+        yield n, str(pregunta).strip(), registro.get(CLAVE_ID)
+        n += 1
+
+
+def ids_hechos(ruta_salida):
+    """Ids ya respondidos sin error en una ejecución anterior."""
+    hechos = set()
+    if os.path.exists(ruta_salida):
+        with open(ruta_salida, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    resultado = json.loads(linea)
+                except json.JSONDecodeError:
+                    continue  # línea a medio escribir si se cortó el proceso
+                if not resultado.get("error"):
+                    hechos.add(resultado["id"])
+    return hechos
+
+
+def _bloques(iterable, tam):
+    iterable = iter(iterable)
+    while bloque := list(islice(iterable, tam)):
+        yield bloque
+
+
+# ==============================================
+# ⚙️ Procesamiento de un bloque
+# ==============================================
+async def recuperar_contextos(bot, bloque, tam_lote=TAM_LOTE_EMBEDDINGS):
+    """Contexto de cada pregunta del bloque (None si la responde una regla, o
+    la excepción si no se pudo recuperar).
+
+    Las preguntas que necesitan embedding se embeben juntas y se buscan con
+    una sola multiplicación de matrices contra el Excel y otra contra los PDFs;
+    con índice léxico el resultado se fusiona con BM25 (también en modo
+    "filtrada": la multiplicación ya está amortizada en el bloque). Si la API
+    de embeddings falla, el bloque se responde solo con BM25; sin índice
+    léxico, sus preguntas pendientes quedan con el error.
+    """
+    contextos, pendientes = {}, []
+    for id_, pregunta, _ in bloque:
+        if bot.enrutador.detectar(normalizar_enrutado(pregunta), contar=False):
+            contextos[id_] = None
+            continue
+        contextos[id_] = bot.contexto_sin_embeddings(pregunta)
+        if contextos[id_] is None:
+            pendientes.append((id_, pregunta, normalizar_embedding(pregunta)))
+    if not pendientes:
+        return contextos
+
+    lexicos = await asyncio.to_thread(lambda: [bot.buscar_lexico(p) for _, p, _ in pendientes])
+    textos = sorted({texto for _, _, texto in pendientes})
+    try:
+        lotes = await asyncio.gather(*(
+            bot.cliente.embeddings(textos[i:i + tam_lote], bot.modelo_embeddings)
+            for i in range(0, len(textos), tam_lote)
+        ))
+    except OpenAIError as e:
+        if not bot.usa_lexico:
+            print(f"⚠️ Embeddings no disponibles ({type(e).__name__}) — {len(pendientes)} preguntas quedan con error.")
+            for id_, _, _ in pendientes:
+                contextos[id_] = e
+            return contextos
+        print(f"⚠️ Embeddings no disponibles ({type(e).__name__}) — bloque buscado solo por palabras.")
+        for (id_, _, _), lexico in zip(pendientes, lexicos):
+            contextos[id_] = bot.contexto_lexico(lexico)
+        return contextos
+    vectores = dict(zip(textos, (v for lote in lotes for v in lote)))
+    matriz = np.asarray([vectores[texto] for _, _, texto in pendientes], dtype=np.float32)
+
+    kb = bot.kb
+    (indices, similitudes), (indices_pdf, similitudes_pdf) = await asyncio.gather(
+        asyncio.to_thread(kb.busqueda_consultas.buscar, matriz, TOP_K),
+        asyncio.to_thread(kb.busqueda_pdfs.buscar, matriz, TOP_K_PDF if kb.nombres_pdf else 0),
+    )
+    for j, ((id_, _, _), lexico) in enumerate(zip(pendientes, lexicos)):
+        resultados = (indices[j], similitudes[j], indices_pdf[j], similitudes_pdf[j])
+        if lexico is not None:
+            resultados = bot.combinar_lexicos(matriz[j], resultados, lexico)
+        contextos[id_] = bot.contexto_de_busqueda(matriz[j], *resultados)
+    return contextos
+
+
+async def responder_una(bot, id_, pregunta, contexto, id_entrada=None):
+    """Resultado de una pregunta; la latencia no incluye la recuperación del bloque."""
+    inicio = time.perf_counter()
+    resultado = {"id": id_, "pregunta": pregunta}
+    if id_entrada is not None:
+        resultado["id_entrada"] = id_entrada
+    try:
+        if isinstance(contexto, Exception):
+            raise contexto
+        respuesta, preparada = await bot.responder(pregunta, contexto)
+        contexto = preparada.contexto
+        fila = None if contexto is None else contexto.fila
+        resultado.update(
+            respuesta=respuesta,
+            origen=preparada.origen,
+            ruta=preparada.ruta,
+            fila=fila,
+            consulta_similar=None if fila is None else bot.kb.pares[fila][0],
+            similitud=None if contexto is None or contexto.similitud is None else round(contexto.similitud, 4),
+        )
+    except Exception as e:
+        # Se anota y se sigue: al relanzar, las preguntas con error se repiten
+        resultado["error"] = f"{type(e).__name__}: {e}"
+    resultado["latencia_s"] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+async def procesar(bot, preguntas, salida, tam_bloque=TAM_BLOQUE):
+    """Responde `preguntas` ((id, texto, id_entrada)) y añade un resultado JSON por línea a `salida`."""
+    totales = {"respondidas": 0, "errores": 0}
+    inicio = time.perf_counter()
+    for bloque in _bloques(preguntas, tam_bloque):
+        contextos = await recuperar_contextos(bot, bloque)
+        # Las respuestas se piden todas a la vez; el semáforo del cliente limita cuántas van en paralelo
+        tareas = [asyncio.ensure_future(responder_una(bot, i, p, contextos[i], e)) for i, p, e in bloque]
+        for tarea in asyncio.as_completed(tareas):
+            resultado = await tarea
+            # default=str: los id de un Excel pueden ser fechas u otros tipos no JSON
+            salida.write(json.dumps(resultado, ensure_ascii=False, default=str) + "\n")
+            salida.flush()
+            totales["errores" if "error" in resultado else "respondidas"] += 1
+        hechas = totales["respondidas"] + totales["errores"]
+        print(f"   {hechas} preguntas ({hechas / (time.perf_counter() - inicio):.1f}/s), {totales['errores']} con error")
+    return totales
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Responde en lote las preguntas de un fichero xlsx, csv o jsonl.")
+    parser.add_argument("entrada", help="Fichero de preguntas (xlsx, csv o jsonl)")
+    parser.add_argument("salida", help="Fichero jsonl de resultados (se añade; permite reanudar)")
+    parser.add_argument("--columna", help="Columna con la pregunta (por defecto la primera; en JSONL, \"pregunta\"; o role/content)")
+    parser.add_argument("--excel", default=RUTA_EXCEL, help="Excel de la base de conocimiento")
+    parser.add_argument("--indice", default=DIRECTORIO_INDICE, help="Directorio del índice de embeddings")
+    parser.add_argument("--pdfs", default=CARPETA_PDFS, help="Carpeta de los PDFs indexados")
+    parser.add_argument("--modo-busqueda", default=MODO_BUSQUEDA, choices=("float32", "float16", "int8"))
+    parser.add_argument("--recuperacion", default=RECUPERACION, choices=MODOS_RECUPERACION,
+                        help="Solo embeddings, o combinados con el índice léxico (BM25)")
+    parser.add_argument("--concurrencia", type=int, default=CONCURRENCIA, help="Peticiones a la API en paralelo")
+    parser.add_argument("--tam-bloque", type=int, default=TAM_BLOQUE, help="Preguntas recuperadas a la vez")
+    parser.add_argument("--sin-cache", action="store_true", help="No usar la caché de respuestas")
+    parser.add_argument("--trazas", help="Fichero jsonl donde guardar la traza de cada respuesta")
+    args = parser.parse_args()
+
+    kb = cargar_base_conocimiento(args.excel, args.indice, args.pdfs, args.modo_busqueda)
+    cliente = ClienteOpenAI(api_key=os.getenv("OPENAI_API_KEY"), concurrencia=args.concurrencia)
+    trazas = RegistroTrazas(args.trazas) if args.trazas else None
+    bot = Chatbot(
+        kb, cliente, cache_respuestas=None if args.sin_cache else CacheRespuestas(), trazas=trazas,
+        recuperacion=args.recuperacion,
+    )
+
+    hechos = ids_hechos(args.salida)
+    if hechos:
+        print(f"↩️ Reanudando: {len(hechos)} preguntas ya respondidas en '{args.salida}'")
+        # Si el corte dejó una línea a medias, los resultados nuevos empiezan en otra
+        with open(args.salida, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    pendientes = (pregunta for pregunta in leer_preguntas(args.entrada, args.columna) if pregunta[0] not in hechos)
+
+    inicio = time.perf_counter()
+    try:
+        with open(args.salida, "a", encoding="utf-8") as salida:
+            totales = cliente.ejecutar(procesar(bot, pendientes, salida, args.tam_bloque))
+    finally:
+        cliente.cerrar()
+    print(
+        f"✅ {totales['respondidas']} respondidas, {totales['errores']} con error "
+        f"en {time.perf_counter() - inicio:.1f}s → '{args.salida}'"
+    )
+    if trazas is not None:
+        for etapa, medida in sorted(trazas.percentiles().items()):
+            print(f"   {etapa:>22}: p50 {medida['p50']:.1f} ms, p95 {medida['p95']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
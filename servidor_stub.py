@@ -0,0 +1,133 @@
+# ==============================================
+# 🧪 Servidor local que imita la API de OpenAI (embeddings y chat)
+# Uso: python servidor_stub.py [--puerto 8001] [--latencia 0.2] [--fallos 0.1]
+# y después: OPENAI_BASE_URL=http://127.0.0.1:8001/v1 streamlit run app.py
+# ==============================================
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backend_falso import DIMENSION, respuesta_falsa, uso_falso, vector_falso
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, estado, cuerpo):
+        datos = json.dumps(cuerpo).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_POST(self):
+        servidor = self.server
+        peticion = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        servidor.contadores[self.path] = servidor.contadores.get(self.path, 0) + 1
+        time.sleep(servidor.latencia)
+        if servidor.fallos and servidor.azar.random() < servidor.fallos:
+            servidor.rechazadas[self.path] = servidor.rechazadas.get(self.path, 0) + 1
+            self._json(429, {"error": {"message": "Rate limit (simulado)", "type": "rate_limit_error"}})
+            return
+
+        if self.path.endswith("/embeddings"):
+            entradas = peticion["input"]
+            entradas = [entradas] if isinstance(entradas, str) else entradas
+            self._json(200, {
+                "object": "list",
+                "model": peticion.get("model", ""),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": vector_falso(t, servidor.dimension).tolist()}
+                    for i, t in enumerate(entradas)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+        elif self.path.endswith("/chat/completions"):
+            prompt = peticion["messages"][-1]["content"]
+            texto = respuesta_falsa(prompt)
+            uso = uso_falso(prompt, texto)
+            uso["total_tokens"] = uso["prompt_tokens"] + uso["completion_tokens"]
+            base = {"id": "stub", "created": int(time.time()), "model": peticion.get("model", "")}
+            if not peticion.get("stream"):
+                self._json(200, {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [{
+                        "index": 0, "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": texto},
+                    }],
+                    "usage": uso,
+                })
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for token in re.findall(r"\S+\s*", texto):
+                evento = {
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(evento)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(servidor.latencia_token)
+            if (peticion.get("stream_options") or {}).get("include_usage"):
+                evento = {**base, "object": "chat.completion.chunk", "choices": [], "usage": uso}
+                self.wfile.write(f"data: {json.dumps(evento)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+        else:
+            self._json(404, {"error": {"message": f"Ruta desconocida: {self.path}"}})
+
+
+def arrancar(puerto=0, latencia=0.0, latencia_token=0.0, fallos=0.0, dimension=DIMENSION, semilla=None):
+    """Arranca el servidor en un hilo y lo devuelve; su URL base está en `servidor.url`.
+
+    Con puerto=0 se elige uno libre. `servidor.contadores` cuenta las
+    peticiones por ruta y `servidor.rechazadas` las que recibieron un 429
+    simulado; con `semilla`, los fallos se repiten igual en cada ejecución.
+    Se para con `servidor.shutdown()`.
+    """
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), _Manejador)
+    servidor.daemon_threads = True
+    servidor.latencia = latencia
+    servidor.latencia_token = latencia_token
+    servidor.fallos = fallos
+    servidor.dimension = dimension
+    servidor.azar = random.Random(semilla)
+    servidor.contadores = {}
+    servidor.rechazadas = {}
+    servidor.url = f"http://127.0.0.1:{servidor.server_address[1]}/v1"
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Imitación local de la API de OpenAI para pruebas.")
+    parser.add_argument("--puerto", type=int, default=8001)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Segundos de espera por petición")
+    parser.add_argument("--latencia-token", type=float, default=0.0, help="Segundos entre tokens en streaming")
+    parser.add_argument("--fallos", type=float, default=0.0, help="Fracción de peticiones que devuelven 429")
+    parser.add_argument("--dimension", type=int, default=DIMENSION)
+    args = parser.parse_args()
+
+    servidor = arrancar(args.puerto, args.latencia, args.latencia_token, args.fallos, args.dimension)
+    print(f"🧪 API simulada en {servidor.url} (Ctrl+C para parar)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# ==============================================
+# 📈 Trazas por petición y métricas agregadas
+# JSONL rotativo + contadores e histogramas en formato Prometheus
+# ==============================================
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+import numpy as np
+
+RUTA_TRAZAS = "trazas.jsonl"
+# /metrics no tiene autenticación: por defecto solo se escucha en local
+HOST_METRICAS = os.getenv("METRICAS_HOST", "127.0.0.1")
+MAX_BYTES_TRAZAS = 10 * 1024 * 1024
+COPIAS_TRAZAS = 5
+# Trazas recientes que se guardan en memoria para los percentiles del panel
+RECIENTES = 1_000
+# Límites (segundos) de los histogramas de latencia
+CUBETAS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_traza_actual = ContextVar("traza_actual", default=None)
+
+
+class Traza:
+    """Datos de una petición: tiempos por etapa (ms), ruta, similitudes, tokens y cachés.
+
+    Se crea al empezar a responder y se cierra con `terminar` cuando se ha
+    entregado el último trozo de la respuesta.
+    """
+
+    def __init__(self, registro, pregunta):
+        self._registro = registro
+        self._inicio = time.perf_counter()
+        self.id = uuid.uuid4().hex[:12]
+        self.fecha = time.time()
+        self.pregunta = pregunta[:300]
+        self.etapas = {}
+        self.datos = {}
+        self.cache = {}
+        self.tokens = {}
+        self._terminada = False
+
+    @contextmanager
+    def etapa(self, nombre):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sumar(nombre, time.perf_counter() - inicio)
+
+    def sumar(self, nombre, segundos):
+        self.etapas[nombre] = self.etapas.get(nombre, 0.0) + segundos * 1000
+
+    def marcar(self, nombre):
+        """Guarda como etapa `nombre` el tiempo transcurrido desde el inicio de la petición."""
+        self.etapas.setdefault(nombre, (time.perf_counter() - self._inicio) * 1000)
+
+    def anotar(self, **datos):
+        self.datos.update(datos)
+
+    def anotar_cache(self, cache, acierto):
+        self.cache[cache] = bool(acierto)
+
+    def anotar_tokens(self, **tokens):
+        for tipo, n in tokens.items():
+            self.tokens[tipo] = self.tokens.get(tipo, 0) + int(n or 0)
+
+    def terminar(self, error=None):
+        if self._terminada:
+            return
+        self._terminada = True
+        self.etapas["total"] = (time.perf_counter() - self._inicio) * 1000
+        if error is not None:
+            self.datos["error"] = f"{type(error).__name__}: {error}"
+        self._registro.registrar(self)
+
+    def como_dict(self):
+        return {
+            "id": self.id,
+            "fecha": round(self.fecha, 3),
+            "pregunta": self.pregunta,
+            **self.datos,
+            "etapas_ms": {k: round(v, 2) for k, v in self.etapas.items()},
+            "cache": self.cache,
+            "tokens": self.tokens,
+        }
+
+
+class _TrazaNula:
+    """Sustituye a Traza cuando no hay registro: todas las operaciones son no-ops."""
+
+    @contextmanager
+    def etapa(self, nombre):
+        yield
+
+    def sumar(self, nombre, segundos):
+        pass
+
+    def marcar(self, nombre):
+        pass
+
+    def anotar(self, **datos):
+        pass
+
+    def anotar_cache(self, cache, acierto):
+        pass
+
+    def anotar_tokens(self, **tokens):
+        pass
+
+    def terminar(self, error=None):
+        pass
+
+
+TRAZA_NULA = _TrazaNula()
+
+
+def traza_actual():
+    """Traza de la petición en curso (se propaga a corrutinas y a asyncio.to_thread)."""
+    return _traza_actual.get() or TRAZA_NULA
+
+
+def activar(traza):
+    """Hace de `traza` la traza en curso en el contexto actual."""
+    _traza_actual.set(traza)
+
+
+class RegistroTrazas:
+    """Escribe cada traza en un JSONL rotativo y agrega métricas del proceso."""
+
+    def __init__(self, ruta=RUTA_TRAZAS, max_bytes=MAX_BYTES_TRAZAS, copias=COPIAS_TRAZAS, recientes=RECIENTES):
+        self.ruta = ruta
+        self._log = None
+        if ruta:
+            self._log = logging.getLogger(f"trazas.{ruta}")
+            self._log.setLevel(logging.INFO)
+            self._log.propagate = False
+            if not self._log.handlers:
+                manejador = RotatingFileHandler(ruta, maxBytes=max_bytes, backupCount=copias, encoding="utf-8")
+                manejador.setFormatter(logging.Formatter("%(message)s"))
+                self._log.addHandler(manejador)
+        self._lock = threading.Lock()
+        self._recientes = deque(maxlen=recientes)
+        self._peticiones = Counter()
+        self._cache = Counter()
+        self._tokens = Counter()
+        self._errores = 0
+        self._cubetas = defaultdict(lambda: [0] * (len(CUBETAS) + 1))
+        self._sumas = Counter()
+
+    def nueva(self, pregunta):
+        return Traza(self, pregunta)
+
+    def registrar(self, traza):
+        registro = traza.como_dict()
+        if self._log is not None:
+            self._log.info(json.dumps(registro, ensure_ascii=False))
+        with self._lock:
+            self._recientes.append(registro)
+            self._peticiones[(registro.get("ruta", ""), registro.get("origen", ""))] += 1
+            self._errores += "error" in registro
+            for cache, acierto in traza.cache.items():
+                self._cache[(cache, "acierto" if acierto else "fallo")] += 1
+            self._tokens.update(traza.tokens)
+            for etapa, ms in traza.etapas.items():
+                segundos = ms / 1000
+                self._cubetas[etapa][int(np.searchsorted(CUBETAS, segundos))] += 1
+                self._sumas[etapa] += segundos
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def percentiles(self, percentiles=(50, 95, 99)):
+        """{etapa: {"n", "p50", "p95", ...}} en ms sobre las trazas recientes."""
+        with self._lock:
+            recientes = list(self._recientes)
+        por_etapa = defaultdict(list)
+        for registro in recientes:
+            for etapa, ms in registro["etapas_ms"].items():
+                por_etapa[etapa].append(ms)
+        return {
+            etapa: {"n": len(valores), **{f"p{p}": float(np.percentile(valores, p)) for p in percentiles}}
+            for etapa, valores in por_etapa.items()
+        }
+
+    def resumen(self):
+        """Contadores agregados del proceso."""
+        with self._lock:
+            return {
+                "peticiones": {f"{r}/{o}": n for (r, o), n in self._peticiones.items()},
+                "cache": {f"{c}/{r}": n for (c, r), n in self._cache.items()},
+                "tokens": dict(self._tokens),
+                "errores": self._errores,
+            }
+
+    def prometheus(self):
+        """Métricas en el formato de texto de Prometheus."""
+        lineas = []
+
+        def familia(nombre, tipo, ayuda):
+            lineas.extend([f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"])
+
+        with self._lock:
+            familia("chatbot_peticiones_total", "counter", "Peticiones respondidas por ruta y origen.")
+            for (ruta, origen), n in sorted(self._peticiones.items()):
+                lineas.append(f'chatbot_peticiones_total{{ruta="{ruta}",origen="{origen}"}} {n}')
+            familia("chatbot_errores_total", "counter", "Peticiones terminadas con error.")
+            lineas.append(f"chatbot_errores_total {self._errores}")
+            familia("chatbot_cache_total", "counter", "Consultas a las cachés por resultado.")
+            for (cache, resultado), n in sorted(self._cache.items()):
+                lineas.append(f'chatbot_cache_total{{cache="{cache}",resultado="{resultado}"}} {n}')
+            familia("chatbot_tokens_total", "counter", "Tokens del modelo de chat.")
+            for tipo, n in sorted(self._tokens.items()):
+                lineas.append(f'chatbot_tokens_total{{tipo="{tipo}"}} {n}')
+            familia("chatbot_etapa_segundos", "histogram", "Duración de cada etapa de la respuesta.")
+            for etapa, cubetas in sorted(self._cubetas.items()):
+                acumulado = 0
+                for limite, n in zip(CUBETAS + ("+Inf",), cubetas):
+                    acumulado += n
+                    lineas.append(f'chatbot_etapa_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {acumulado}')
+                lineas.append(f'chatbot_etapa_segundos_sum{{etapa="{etapa}"}} {self._sumas[etapa]:.6f}')
+                lineas.append(f'chatbot_etapa_segundos_count{{etapa="{etapa}"}} {acumulado}')
+        return "\n".join(lineas) + "\n"
+
+
+def servir_metricas(registro, puerto, host=HOST_METRICAS):
+    """Expone /metrics en `host`:`puerto` desde un hilo en segundo plano y devuelve el servidor.
+
+    Lanza OSError si el puerto está ocupado (p. ej. por otro proceso de la app).
+    """
+
+    class Manejador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            datos = registro.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+    servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor